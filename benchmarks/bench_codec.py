@@ -0,0 +1,42 @@
+"""
+Compare JWT codec backends.
+
+Run with: python benchmarks/bench_codec.py
+"""
+
+import os
+import sys
+import timeit
+from datetime import UTC, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastauth.codec import HMACJWTCodec, JoseJWTCodec  # noqa: E402
+
+SECRET = "benchmark_secret_key"
+NUMBER = 20_000
+
+
+def bench(name: str, func) -> None:
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+    print(f"{name:<24} {NUMBER / seconds:>12,.0f} ops/sec")
+
+
+def main() -> None:
+    claims = {
+        "sub": "user123",
+        "roles": ["admin", "user"],
+        "type": "access",
+        "ver": 0,
+        "exp": datetime.now(UTC) + timedelta(minutes=30),
+    }
+
+    for codec in (JoseJWTCodec(SECRET), HMACJWTCodec(SECRET)):
+        token = codec.encode(claims)
+        name = type(codec).__name__
+        bench(f"{name}.encode", lambda codec=codec: codec.encode(claims))
+        bench(f"{name}.decode", lambda codec=codec, token=token: codec.decode(token))
+
+
+if __name__ == "__main__":
+    main()
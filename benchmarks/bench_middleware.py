@@ -0,0 +1,112 @@
+"""
+Compare the raw ASGI AuthMiddleware with the previous BaseHTTPMiddleware version.
+
+Requests are driven straight through the ASGI app, so the numbers measure
+middleware and routing overhead without any server or network in between.
+
+Run with: python benchmarks/bench_middleware.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from fastauth.middleware import AuthMiddleware  # noqa: E402
+from fastauth.models import User  # noqa: E402
+from fastauth.token import averify_token, generate_token, setup_token_manager  # noqa: E402
+
+REQUESTS = 5_000
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware implementation AuthMiddleware replaced"""
+
+    def __init__(self, app, exclude_paths=None):
+        super().__init__(app)
+        self.exclude_paths = exclude_paths or []
+
+    async def dispatch(self, request: Request, call_next):
+        path = request.url.path
+        if any(path.startswith(excluded) for excluded in self.exclude_paths):
+            return await call_next(request)
+
+        auth_header = request.headers.get("Authorization")
+        token = auth_header.replace("Bearer ", "") if auth_header and auth_header.startswith("Bearer ") else None
+        if not token:
+            return await call_next(request)
+
+        try:
+            request.state.user = await averify_token(token)
+            return await call_next(request)
+        except Exception:
+            return JSONResponse(
+                status_code=401,
+                content={"detail": "Invalid authentication credentials"},
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(middleware, exclude_paths=["/docs"])
+
+    @app.get("/protected")
+    async def protected(request: Request):
+        return {"user_id": request.state.user.user_id}
+
+    return app
+
+
+async def run(app: FastAPI, headers: list[tuple[bytes, bytes]], expected_status: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/protected",
+        "raw_path": b"/protected",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 12345),
+        "server": ("testserver", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == expected_status, message["status"]
+
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    setup_token_manager(secret_key="benchmark_secret_key", verify_cache_size=1024)
+    token = generate_token(User(id="user123", username="bench", roles=["user"])).access_token
+    valid = [(b"host", b"testserver"), (b"authorization", f"Bearer {token}".encode())]
+    invalid = [(b"host", b"testserver"), (b"authorization", b"Bearer invalid.token.string")]
+
+    for name, middleware in (("BaseHTTPMiddleware", LegacyAuthMiddleware), ("ASGI AuthMiddleware", AuthMiddleware)):
+        app = build_app(middleware)
+        for label, headers, status in (("valid token", valid, 200), ("invalid token", invalid, 401)):
+            # Warm up routing and the verify cache before timing
+            asyncio.run(run(app, headers, status))
+            seconds = min(asyncio.run(run(app, headers, status)) for _ in range(3))
+            print(f"{name:<20} {label:<14} {REQUESTS / seconds:>10,.0f} req/sec")
+
+
+if __name__ == "__main__":
+    main()
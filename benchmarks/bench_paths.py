@@ -0,0 +1,39 @@
+"""
+Compare excluded-path matching as the number of patterns grows.
+
+Run with: python benchmarks/bench_paths.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastauth.paths import PathMatcher  # noqa: E402
+
+NUMBER = 200_000
+# A typical authenticated request, which has to be checked against every pattern
+PATH = "/api/v1/users/12345/orders"
+
+
+def bench(name: str, func) -> None:
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+    print(f"{name:<32} {NUMBER / seconds:>12,.0f} ops/sec")
+
+
+def main() -> None:
+    for count in (1, 50, 500):
+        patterns = [f"/excluded/{i}" for i in range(count)]
+        matcher = PathMatcher(patterns)
+        assert not matcher.matches(PATH)
+
+        bench(f"any(startswith) x{count}", lambda patterns=patterns: any(PATH.startswith(p) for p in patterns))
+        bench(f"PathMatcher x{count}", lambda matcher=matcher: matcher.matches(PATH))
+
+    globs = PathMatcher([f"/excluded/{i}/*" for i in range(500)] + [f"=/excluded/{i}" for i in range(500)])
+    bench("PathMatcher x1000 exact/glob", lambda: globs.matches(PATH))
+
+
+if __name__ == "__main__":
+    main()
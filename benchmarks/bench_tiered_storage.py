@@ -0,0 +1,114 @@
+"""
+Compare verifying tokens against Redis alone and through TieredTokenStorage.
+
+Redis is replaced by an in-process fake that sleeps for a fixed latency on
+every round trip, so the numbers show how many round trips the local tier
+saves for a workload where a few users send most of the requests.
+
+Run with: python benchmarks/bench_tiered_storage.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastauth.storage import RedisTokenStorage  # noqa: E402
+from fastauth.tiered_storage import TieredTokenStorage  # noqa: E402
+from fastauth.token import TokenManager  # noqa: E402
+
+LATENCY = 0.0005
+USERS = 200
+REQUESTS = 2_000
+
+
+class LatencyRedis:
+    """The few Redis commands the verify path uses, each round trip sleeping for LATENCY"""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.round_trips = 0
+        self.data: dict[str, str] = {}
+
+    def _round_trip(self) -> None:
+        self.round_trips += 1
+        time.sleep(self.latency)
+
+    def get(self, key):
+        self._round_trip()
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, px=None):
+        self._round_trip()
+        self.data[key] = value
+
+    def incr(self, key):
+        self._round_trip()
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def mget(self, keys):
+        self._round_trip()
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return LatencyPipeline(self)
+
+    def register_script(self, script):
+        return lambda keys=(), args=(): self._round_trip()
+
+
+class LatencyPipeline:
+    def __init__(self, redis: LatencyRedis) -> None:
+        self.redis = redis
+        self.commands: list = []
+
+    def exists(self, key):
+        self.commands.append(lambda: int(key in self.redis.data))
+
+    def get(self, key):
+        self.commands.append(lambda: self.redis.data.get(key))
+
+    def mget(self, keys):
+        self.commands.append(lambda: [self.redis.data.get(key) for key in keys])
+
+    def execute(self):
+        self.redis._round_trip()
+        results = [command() for command in self.commands]
+        self.commands = []
+        return results
+
+
+def run(storage_factory) -> tuple[float, int, TokenManager]:
+    redis = LatencyRedis(LATENCY)
+    manager = TokenManager(secret_key="benchmark_secret_key", token_storage=storage_factory(RedisTokenStorage(redis)))
+    tokens = [
+        manager.create_access_token({"sub": f"user{i}", "username": f"user{i}", "roles": ["user"]})
+        for i in range(USERS)
+    ]
+    # Skewed traffic: a handful of users send most requests
+    rng = random.Random(0)
+    workload = [tokens[min(int(rng.paretovariate(1.2)) - 1, USERS - 1)] for _ in range(REQUESTS)]
+
+    redis.round_trips = 0
+    start = time.perf_counter()
+    for token in workload:
+        manager.verify_token(token)
+    return time.perf_counter() - start, redis.round_trips, manager
+
+
+def main() -> None:
+    print(f"{REQUESTS} verifications, {USERS} users, {LATENCY * 1000:.1f} ms per round trip")
+    for name, factory in (("Redis", lambda remote: remote), ("Tiered", TieredTokenStorage)):
+        seconds, round_trips, manager = run(factory)
+        line = f"{name:<8} {REQUESTS / seconds:>10,.0f} verifications/sec {round_trips:>6} round trips"
+        if isinstance(manager.token_storage, TieredTokenStorage):
+            ratio = manager.token_storage.stats()["is_token_revoked"]["hit_ratio"]
+            line += f"  L1 hit ratio {ratio:.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compare pydantic TokenData with the slotted FastTokenData on the verify path.
+
+Reports ns per verify and the memory each verify result holds (tracemalloc),
+both for building the token data alone and for a full uncached verify.
+
+Run with: python benchmarks/bench_token_data.py
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastauth.models import User  # noqa: E402
+from fastauth.token import TokenManager  # noqa: E402
+
+SECRET = "benchmark_secret_key"
+NUMBER = 20_000
+
+
+def allocated_per_call(func, number: int = 2_000) -> float:
+    """Average bytes held by each result, measured while all results are kept alive"""
+    func()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = [func() for _ in range(number)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return (after - before) / number
+
+
+def bench(name: str, func) -> None:
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+    print(f"{name:<28} {seconds / NUMBER * 1e9:>10,.0f} ns/op {allocated_per_call(func):>10,.0f} B/op")
+
+
+def main() -> None:
+    user = User(id="user123", username="bench", roles=["admin", "user"], scopes=["orders:read", "billing:*"])
+
+    for fast in (False, True):
+        manager = TokenManager(SECRET, fast_token_data=fast)
+        token = manager.generate_tokens(user).access_token
+        payload = manager._decode_token(token)
+        label = "FastTokenData" if fast else "TokenData"
+
+        bench(
+            f"{label} build",
+            lambda manager=manager, token=token, payload=payload: manager._check_token_state(token, payload, False, 0),
+        )
+        bench(f"{label} verify", lambda manager=manager, token=token: manager.verify_token(token))
+
+
+if __name__ == "__main__":
+    main()
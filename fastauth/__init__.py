@@ -1,10 +1,18 @@
-from .csrf import csrf_protection, generate_csrf_token, verify_csrf_token
-from .dependencies import require_auth, require_role
+from .csrf import averify_csrf_token, csrf_protection, generate_csrf_token, verify_csrf_token
+from .dependencies import require_auth, require_role, require_scopes
 from .middleware import AuthMiddleware, register_auth_middleware
-from .models import TokenData, TokenResponse, User
+from .models import FastTokenData, TokenData, TokenResponse, User
+from .policy import AuthPolicy
+from .ratelimit import MemoryRateLimiter, RedisRateLimiter
+from .roles import register_role
 from .token import (
+    agenerate_token,
+    arefresh_token,
+    arevoke_token,
+    averify_token,
     clear_expired_revocations,
     generate_token,
+    generate_tokens_many,
     is_token_revoked,
     refresh_token,
     revoke_all_user_tokens,
@@ -12,26 +20,40 @@ from .token import (
     rotate_user_tokens,
     setup_token_manager,
     verify_token,
+    verify_tokens_many,
 )
 
 __all__ = [
     "AuthMiddleware",
     "register_auth_middleware",
+    "MemoryRateLimiter",
+    "RedisRateLimiter",
     "require_auth",
     "require_role",
+    "require_scopes",
+    "AuthPolicy",
+    "register_role",
     "generate_token",
+    "agenerate_token",
+    "generate_tokens_many",
     "verify_token",
+    "averify_token",
+    "verify_tokens_many",
     "refresh_token",
+    "arefresh_token",
     "setup_token_manager",
     "revoke_token",
+    "arevoke_token",
     "revoke_all_user_tokens",
     "is_token_revoked",
     "rotate_user_tokens",
     "clear_expired_revocations",
     "generate_csrf_token",
     "verify_csrf_token",
+    "averify_csrf_token",
     "csrf_protection",
     "User",
     "TokenData",
+    "FastTokenData",
     "TokenResponse",
 ]
@@ -0,0 +1,316 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any
+
+from redis.asyncio import Redis as AsyncRedis
+
+from .near_cache import UserStateNearCache
+from .storage import (
+    CSRF_CLEANUP_BATCH,
+    CSRF_VERIFY_SCRIPT,
+    InvalidationListener,
+    InvalidationNotifier,
+    RedisKeyspace,
+    TokenStorage,
+)
+from .utils import token_digest
+
+
+# Abstract base class for storage used from the event loop
+class AsyncTokenStorage(InvalidationNotifier, ABC):
+    @abstractmethod
+    async def add_revoked_token(self, token: str, user_id: str | None = None, expires_at: float | None = None) -> None:
+        """Add a token to the revocation list until ``expires_at``, the token's own exp timestamp"""
+        pass
+
+    @abstractmethod
+    async def revoke_all_user_tokens(self, user_id: str) -> None:
+        """Revoke all tokens for a user"""
+        pass
+
+    @abstractmethod
+    async def is_token_revoked(self, token: str, user_id: str | None = None) -> bool:
+        """Check if a token is revoked"""
+        pass
+
+    @abstractmethod
+    async def clear_expired_tokens(self, current_time: float) -> None:
+        """Clear expired tokens from storage"""
+        pass
+
+    @abstractmethod
+    async def get_user_token_version(self, user_id: str) -> int:
+        return (await self.get_user_token_versions([user_id]))[user_id]
+
+    async def get_user_token_versions(self, user_ids: list[str]) -> dict[str, int]:
+        versions, missing = self._cached_versions(user_ids)
+        if missing:
+            generation = self._near_cache_generation()
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_versions(pipe, missing)
+            versions.update(self._read_versions(iter(await pipe.execute()), missing, generation))
+        return versions
+
+    async def get_token_state(self, token: str, user_id: str | None = None) -> tuple[bool, int]:
+        cached = self._cached_user_state(user_id)
+        if cached is not None and cached[0]:
+            return cached
+
+        # Revocation flags and, unless cached, the user's state come back in a single round trip
+        generation = self._near_cache_generation()
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_token_lookup(pipe, token, user_id, cached)
+        return self._read_token_lookup(iter(await pipe.execute()), user_id, cached, generation)
+
+    async def get_token_states(self, tokens: list[tuple[str, str | None]]) -> list[tuple[bool, int]]:
+        """Get (revoked, current user token version) for many (token, user_id) pairs"""
+        return [await self.get_token_state(token, user_id) for token, user_id in tokens]
+
+    # CSRF token methods
+    @abstractmethod
+    async def store_csrf_token(self, user_id: str, token_hash: str, expires_at: datetime) -> None:
+        """Store a CSRF token"""
+        pass
+
+    @abstractmethod
+    async def verify_csrf_token(self, user_id: str, token_hash: str, consume: bool = False) -> bool:
+        """Verify a CSRF token exists, is valid and unused, marking it used if ``consume``"""
+        pass
+
+    @abstractmethod
+    async def clear_old_csrf_tokens(self, user_id: str | None = None, max_age_hours: int = 24) -> None:
+        """Clear expired CSRF tokens"""
+        pass
+
+
+# Exposes a synchronous storage to async callers
+class SyncTokenStorageAdapter(AsyncTokenStorage):
+    """
+    Async view of a TokenStorage.
+
+    Storages that perform I/O run in a worker thread so they never block the
+    event loop; in-memory storage is called inline.
+    """
+
+    def __init__(self, storage: TokenStorage) -> None:
+        self.storage = storage
+
+    async def _call(self, method: str, *args: Any) -> Any:
+        func = getattr(self.storage, method)
+        if self.storage.performs_io:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def add_invalidation_listener(self, listener: InvalidationListener) -> None:
+        # The wrapped storage performs the writes, so it fires the notifications
+        self.storage.add_invalidation_listener(listener)
+
+    async def add_revoked_token(self, token: str, user_id: str | None = None, expires_at: float | None = None) -> None:
+        await self._call("add_revoked_token", token, user_id, expires_at)
+
+    async def revoke_all_user_tokens(self, user_id: str) -> None:
+        await self._call("revoke_all_user_tokens", user_id)
+
+    async def is_token_revoked(self, token: str, user_id: str | None = None) -> bool:
+        revoked: bool = await self._call("is_token_revoked", token, user_id)
+        return revoked
+
+    async def clear_expired_tokens(self, current_time: float) -> None:
+        await self._call("clear_expired_tokens", current_time)
+
+    async def get_user_token_version(self, user_id: str) -> int:
+        version: int = await self._call("get_user_token_version", user_id)
+        return version
+
+    async def increment_user_token_version(self, user_id: str) -> int:
+        version: int = await self._call("increment_user_token_version", user_id)
+        return version
+
+    async def get_user_token_versions(self, user_ids: list[str]) -> dict[str, int]:
+        versions: dict[str, int] = await self._call("get_user_token_versions", user_ids)
+        return versions
+
+    async def get_token_state(self, token: str, user_id: str | None = None) -> tuple[bool, int]:
+        state: tuple[bool, int] = await self._call("get_token_state", token, user_id)
+        return state
+
+    async def get_token_states(self, tokens: list[tuple[str, str | None]]) -> list[tuple[bool, int]]:
+        states: list[tuple[bool, int]] = await self._call("get_token_states", tokens)
+        return states
+
+    async def store_csrf_token(self, user_id: str, token_hash: str, expires_at: datetime) -> None:
+        await self._call("store_csrf_token", user_id, token_hash, expires_at)
+
+    async def verify_csrf_token(self, user_id: str, token_hash: str, consume: bool = False) -> bool:
+        valid: bool = await self._call("verify_csrf_token", user_id, token_hash, consume)
+        return valid
+
+    async def clear_old_csrf_tokens(self, user_id: str | None = None, max_age_hours: int = 24) -> None:
+        await self._call("clear_old_csrf_tokens", user_id, max_age_hours)
+
+
+# redis.asyncio implementation, uses the same keys as RedisTokenStorage
+class AsyncRedisTokenStorage(RedisKeyspace, AsyncTokenStorage):
+    def __init__(
+        self,
+        redis_client: AsyncRedis,
+        prefix: str = "fastauth:",
+        near_cache: UserStateNearCache | None = None,
+        legacy_revocation_keys: bool = False,
+    ) -> None:
+        self.redis = redis_client
+        self.prefix = prefix
+        self.near_cache = near_cache
+        self.legacy_revocation_keys = legacy_revocation_keys
+        self._verify_csrf = redis_client.register_script(CSRF_VERIFY_SCRIPT)
+        if near_cache is not None:
+            # Let local caches (e.g. the verified-token cache) follow changes made by other processes
+            near_cache.on_remote_invalidation.append(self._notify_invalidation)
+
+    async def add_revoked_token(self, token: str, user_id: str | None = None, expires_at: float | None = None) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_revocation(pipe, token, expires_at)
+        await pipe.execute()
+        self._notify_invalidation(token_digest(token), user_id)
+
+    async def revoke_all_user_tokens(self, user_id: str) -> None:
+        # Flag all user tokens as revoked and bump the token version in one round trip
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self._key("user_all_revoked:", user_id), "1")
+        self._queue_version_increment(pipe, user_id)
+        replies = iter(await pipe.execute())
+        next(replies)
+        self._read_version_increment(replies, user_id)
+        self._notify_invalidation(user_id=user_id)
+
+    async def is_token_revoked(self, token: str, user_id: str | None = None) -> bool:
+        revoked, _ = await self.get_token_state(token, user_id)
+        return revoked
+
+    async def clear_expired_tokens(self, current_time: float) -> None:
+        # Redis handles expiration automatically, nothing to do here
+        pass
+
+    async def get_user_token_version(self, user_id: str) -> int:
+        if self.near_cache is None:
+            version = await self.redis.get(self._key("token_version:", user_id))
+            return int(version) if version else 0
+
+        cached = self.near_cache.get(user_id)
+        if cached is not None:
+            return cached[1]
+
+        generation = self.near_cache.generation
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_user_state(pipe, user_id)
+        all_revoked, version = self._read_user_state(iter(await pipe.execute()))
+        self.near_cache.put(user_id, all_revoked, version, generation)
+        return version
+
+    async def get_user_token_versions(self, user_ids: list[str]) -> dict[str, int]:
+        if not user_ids:
+            return {}
+
+        if self.near_cache is None:
+            versions = await self.redis.mget([self._key("token_version:", user_id) for user_id in user_ids])
+            return {user_id: int(v) if v else 0 for user_id, v in zip(user_ids, versions, strict=True)}
+
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self.near_cache.get(user_id)
+            if cached is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = cached[1]
+
+        if missing:
+            generation = self.near_cache.generation
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id in missing:
+                self._queue_user_state(pipe, user_id)
+            replies = iter(await pipe.execute())
+            for user_id in missing:
+                all_revoked, result[user_id] = self._read_user_state(replies)
+                self.near_cache.put(user_id, all_revoked, result[user_id], generation)
+        return result
+
+    async def get_token_state(self, token: str, user_id: str | None = None) -> tuple[bool, int]:
+        cached = self.near_cache.get(user_id) if self.near_cache is not None and user_id else None
+        if cached is not None:
+            all_revoked, version = cached
+            if all_revoked:
+                return True, version
+
+            # Only the user's state is cached, per-token revocations are always read
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_token_revocation(pipe, token, user_id)
+            return self._read_token_revocation(iter(await pipe.execute()), user_id), version
+
+        # Revocation flags and the current version come back in a single round trip
+        generation = self.near_cache.generation if self.near_cache is not None else 0
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_token_revocation(pipe, token, user_id)
+        if not user_id:
+            return self._read_token_revocation(iter(await pipe.execute()), user_id), 0
+
+        self._queue_user_state(pipe, user_id)
+        replies = iter(await pipe.execute())
+        revoked = self._read_token_revocation(replies, user_id)
+        all_revoked, version = self._read_user_state(replies)
+        if self.near_cache is not None:
+            self.near_cache.put(user_id, all_revoked, version, generation)
+        return revoked or all_revoked, version
+
+    async def get_token_states(self, tokens: list[tuple[str, str | None]]) -> list[tuple[bool, int]]:
+        if not tokens:
+            return []
+
+        # Queue every lookup and send them in a single round trip
+        pipe = self.redis.pipeline(transaction=False)
+        for token, user_id in tokens:
+            self._queue_token_state(pipe, token, user_id)
+        replies = iter(await pipe.execute())
+
+        return [self._read_token_state(replies, user_id) for _, user_id in tokens]
+
+    async def increment_user_token_version(self, user_id: str) -> int:
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_version_increment(pipe, user_id)
+        new_version = self._read_version_increment(iter(await pipe.execute()), user_id)
+        self._notify_invalidation(user_id=user_id)
+        return new_version
+
+    async def store_csrf_token(self, user_id: str, token_hash: str, expires_at: datetime) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_csrf_store(pipe, user_id, token_hash, expires_at)
+        await pipe.execute()
+
+    async def verify_csrf_token(self, user_id: str, token_hash: str, consume: bool = False) -> bool:
+        valid = await self._verify_csrf(keys=[self._csrf_key(user_id, token_hash)], args=[time.time(), int(consume)])
+        return bool(valid)
+
+    async def clear_old_csrf_tokens(self, user_id: str | None = None, max_age_hours: int = 24) -> None:
+        if user_id:
+            await self._clear_expired_csrf([self._csrf_index_key(user_id)])
+            return
+
+        batch: list[Any] = []
+        async for index_key in self.redis.scan_iter(match=self._csrf_index_key("*"), count=CSRF_CLEANUP_BATCH):
+            batch.append(index_key)
+            if len(batch) >= CSRF_CLEANUP_BATCH:
+                await self._clear_expired_csrf(batch)
+                batch = []
+        if batch:
+            await self._clear_expired_csrf(batch)
+
+    async def _clear_expired_csrf(self, index_keys: list[Any]) -> None:
+        """Drop expired tokens from the given indexes, in one round trip plus one delete"""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_csrf_expired(pipe, index_keys, now)
+        expired = self._read_csrf_expired(iter(await pipe.execute()), index_keys)
+        if expired:
+            await self.redis.delete(*expired)
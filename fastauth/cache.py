@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any
+
+from .models import TokenData
+from .utils import token_digest
+
+
+class TTLCache:
+    """
+    Bounded LRU map whose entries expire after ``ttl`` seconds, shared by the
+    caches below.
+
+    Entries may carry tags, so everything tagged with e.g. a user id can be
+    dropped at once. Every invalidation bumps ``generation``: a caller reads
+    it before fetching a value and passes it back to ``set()``, which then
+    skips values fetched before an invalidation, as they may be stale.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (value, expires_at, tags)
+        self._entries: OrderedDict[Hashable, tuple[Any, float, tuple[Hashable, ...]]] = OrderedDict()
+        self._tagged: dict[Hashable, set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for ``key``, or ``default`` if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float | None = None,
+        generation: int | None = None,
+        tags: Iterable[Hashable] = (),
+    ) -> None:
+        """Store a value for ``ttl`` seconds, the cache's TTL by default"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        tags = tuple(tags)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, tags)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, keys: Iterable[Hashable] = (), tags: Iterable[Hashable] = ()) -> None:
+        """Drop ``keys`` and every entry carrying one of ``tags``"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+            for tag in tags:
+                for key in list(self._tagged.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tagged.clear()
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified tokens.
+
+    Entries are keyed by a digest of the encoded token and never outlive the
+    token's own ``exp`` claim or ``ttl`` seconds, whichever comes first.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 60.0) -> None:
+        self._cache = TTLCache(max_size, ttl)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def generation(self) -> int:
+        """Token to pass back to set(), taken before reading the token's storage state"""
+        return self._cache.generation
+
+    def get(self, token: str) -> TokenData | None:
+        """Return cached token data, or None if missing or expired"""
+        token_data: TokenData | None = self._cache.get(token_digest(token))
+        if token_data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return token_data
+
+    def set(self, token: str, token_data: TokenData, exp: float | None = None, generation: int | None = None) -> None:
+        """
+        Cache verified token data until ``exp`` or the cache TTL.
+
+        Nothing is cached if an invalidation happened since ``generation`` was taken.
+        """
+        ttl = self.ttl if exp is None else min(self.ttl, exp - time.time())
+        self._cache.set(token_digest(token), token_data, ttl, generation, tags=(token_data.user_id,))
+
+    def invalidate(self, digest: bytes | None = None, user_id: str | None = None) -> None:
+        """Drop the entry for a token digest and/or every entry for a user"""
+        self._cache.invalidate(
+            keys=(digest,) if digest is not None else (),
+            tags=(str(user_id),) if user_id is not None else (),
+        )
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters"""
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """Return hit/miss counters and the current size"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+
+class NegativeTokenCache:
+    """
+    Bounded LRU cache of recently rejected tokens.
+
+    Repeated bad tokens are answered from here, with the original rejection
+    reason, instead of being decoded again. Entries are keyed by a digest, so
+    a flood of long garbage tokens can't grow memory past ``max_size`` digests.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 60.0) -> None:
+        self._cache = TTLCache(max_size, ttl)
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, token: str) -> str | None:
+        """Return the reason a token was rejected, or None if it wasn't recently"""
+        detail: str | None = self._cache.get(token_digest(token))
+        return detail
+
+    def add(self, token: str, detail: str) -> None:
+        """Remember a rejected token for ``ttl`` seconds"""
+        self._cache.set(token_digest(token), detail, self.ttl)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        self._cache.clear()
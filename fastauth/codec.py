@@ -0,0 +1,162 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from abc import ABC, abstractmethod
+from calendar import timegm
+from datetime import UTC, datetime
+from typing import Any
+
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
+
+_HMAC_HASHES = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+
+_TIME_CLAIMS = ("exp", "iat", "nbf")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+# Abstract base class for JWT encoding backends
+class JWTCodec(ABC):
+    algorithm: str
+
+    @abstractmethod
+    def encode(self, claims: dict[str, Any]) -> str:
+        """Encode and sign a set of claims"""
+        pass
+
+    @abstractmethod
+    def decode(self, token: str) -> dict[str, Any]:
+        """Verify a token and return its claims, raising JWTError if it is invalid"""
+        pass
+
+
+# python-jose implementation, supports every algorithm python-jose does
+class JoseJWTCodec(JWTCodec):
+    def __init__(self, secret_key: str, algorithm: str = "HS256") -> None:
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+
+    def encode(self, claims: dict[str, Any]) -> str:
+        encoded: str = jwt.encode(claims, self.secret_key, algorithm=self.algorithm)
+        return encoded
+
+    def decode(self, token: str) -> dict[str, Any]:
+        claims: dict[str, Any] = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        return claims
+
+
+# Fast built-in HMAC implementation for the HS* algorithms
+class HMACJWTCodec(JWTCodec):
+    """
+    HS256/HS384/HS512 codec producing tokens identical to python-jose.
+
+    The HMAC key schedule and the encoded header segment are computed once,
+    so each call only hashes the signing input and (de)serializes the claims.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str = "HS256") -> None:
+        if algorithm not in _HMAC_HASHES:
+            raise ValueError(f"Unsupported HMAC algorithm: {algorithm}")
+
+        self.algorithm = algorithm
+        self._mac = hmac.new(secret_key.encode(), digestmod=_HMAC_HASHES[algorithm])
+        header = json.dumps({"alg": algorithm, "typ": "JWT"}, separators=(",", ":"), sort_keys=True)
+        self._header = _b64encode(header.encode())
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def encode(self, claims: dict[str, Any]) -> str:
+        to_encode = dict(claims)
+        for time_claim in _TIME_CLAIMS:
+            value = to_encode.get(time_claim)
+            if isinstance(value, datetime):
+                to_encode[time_claim] = timegm(value.utctimetuple())
+
+        payload = _b64encode(json.dumps(to_encode, separators=(",", ":")).encode())
+        signing_input = f"{self._header}.{payload}"
+        return f"{signing_input}.{_b64encode(self._sign(signing_input.encode()))}"
+
+    def decode(self, token: str) -> dict[str, Any]:
+        signing_input, _, signature_segment = token.rpartition(".")
+        header_segment, _, payload_segment = signing_input.partition(".")
+        if not header_segment or not payload_segment or "." in payload_segment:
+            raise JWTError("Not enough segments")
+
+        try:
+            if header_segment != self._header:
+                self._check_header(header_segment)
+
+            signature = _b64decode(signature_segment)
+            if not hmac.compare_digest(signature, self._sign(signing_input.encode("ascii"))):
+                raise JWTError("Signature verification failed.")
+
+            claims = json.loads(_b64decode(payload_segment))
+        except (binascii.Error, UnicodeError, ValueError) as e:
+            raise JWTError("Invalid token") from e
+
+        if not isinstance(claims, dict):
+            raise JWTError("Invalid payload string: must be a json object")
+
+        self._validate_claims(claims)
+        return claims
+
+    def _check_header(self, header_segment: str) -> None:
+        header = json.loads(_b64decode(header_segment))
+        if not isinstance(header, dict) or header.get("alg") != self.algorithm:
+            raise JWTError("The specified alg value is not allowed")
+
+    @staticmethod
+    def _validate_claims(claims: dict[str, Any]) -> None:
+        now = timegm(datetime.now(UTC).utctimetuple())
+
+        if "iat" in claims:
+            try:
+                int(claims["iat"])
+            except (TypeError, ValueError) as e:
+                raise JWTClaimsError("Issued At claim (iat) must be an integer.") from e
+
+        if "nbf" in claims:
+            try:
+                nbf = int(claims["nbf"])
+            except (TypeError, ValueError) as e:
+                raise JWTClaimsError("Not Before claim (nbf) must be an integer.") from e
+            if nbf > now:
+                raise JWTClaimsError("The token is not yet valid (nbf)")
+
+        if "exp" in claims:
+            try:
+                exp = int(claims["exp"])
+            except (TypeError, ValueError) as e:
+                raise JWTClaimsError("Expiration Time claim (exp) must be an integer.") from e
+            if exp < now:
+                raise ExpiredSignatureError("Signature has expired.")
+
+        # Tokens are not issued with an audience, so match python-jose and reject them
+        if "aud" in claims:
+            raise JWTClaimsError("Invalid audience")
+
+        if "sub" in claims and not isinstance(claims["sub"], str):
+            raise JWTClaimsError("Subject must be a string.")
+
+
+def default_codec(secret_key: str, algorithm: str = "HS256") -> JWTCodec:
+    """Return the fastest codec available for an algorithm"""
+    if algorithm in _HMAC_HASHES:
+        return HMACJWTCodec(secret_key, algorithm)
+    return JoseJWTCodec(secret_key, algorithm)
@@ -1,10 +1,15 @@
 import hashlib
+import hmac
 import secrets
+import time
 from collections.abc import Callable
 from datetime import UTC, datetime, timedelta
+from functools import cache
 
 from fastapi import Cookie, Header, HTTPException, Request, status
 
+from .dependencies import _authenticate
+
 # Re-export the storage manager
 from .token import _ensure_token_manager
 
@@ -12,8 +17,50 @@ from .token import _ensure_token_manager
 _csrf_tokens: dict[str, dict[str, str]] = {}
 
 
-def generate_csrf_token(user_id: str, max_age_hours: int = 24) -> str:
-    """Generate a CSRF token for a user"""
+@cache
+def _stateless_key(secret_key: str) -> bytes:
+    # Separate key so a CSRF signature can never be mistaken for a JWT one
+    return hmac.new(secret_key.encode(), b"fastauth:csrf", hashlib.sha256).digest()
+
+
+def _stateless_signature(user_id: str, expires_at: str, salt: str, nonce: str | None) -> str:
+    key = _stateless_key(_ensure_token_manager().secret_key)
+    message = "\0".join((user_id, expires_at, salt, nonce or "")).encode()
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+def _generate_stateless_token(user_id: str, max_age_hours: float, nonce: str | None) -> str:
+    expires_at = str(int(time.time() + max_age_hours * 3600))
+    # Random salt so every render gets a different token
+    salt = secrets.token_hex(8)
+    return f"{expires_at}.{salt}.{_stateless_signature(user_id, expires_at, salt, nonce)}"
+
+
+def _verify_stateless_token(user_id: str, token: str, nonce: str | None) -> bool:
+    # Issued tokens are ASCII; anything else would trip int() ("²" passes isdigit()) or compare_digest()
+    if not token.isascii():
+        return False
+    parts = token.split(".")
+    if len(parts) != 3 or not parts[0].isdigit():
+        return False
+    expires_at, salt, signature = parts
+    if int(expires_at) < time.time():
+        return False
+    return hmac.compare_digest(signature, _stateless_signature(user_id, expires_at, salt, nonce))
+
+
+def generate_csrf_token(
+    user_id: str, max_age_hours: int = 24, stateless: bool = False, nonce: str | None = None
+) -> str:
+    """
+    Generate a CSRF token for a user.
+
+    Stateless tokens carry their expiry and an HMAC over the user id, expiry
+    and optional session ``nonce``, so they are never written to storage.
+    """
+    if stateless:
+        return _generate_stateless_token(user_id, max_age_hours, nonce)
+
     token = secrets.token_hex(32)
 
     # Store token hash for verification
@@ -35,11 +82,19 @@ def generate_csrf_token(user_id: str, max_age_hours: int = 24) -> str:
     return token
 
 
-def verify_csrf_token(user_id: str, token: str) -> bool:
-    """Verify a CSRF token for a user"""
+def verify_csrf_token(
+    user_id: str, token: str, consume: bool = False, stateless: bool = False, nonce: str | None = None
+) -> bool:
+    """Verify a CSRF token for a user, marking it used so it can't be replayed if ``consume``"""
+    if stateless and consume:
+        raise ValueError("Stateless CSRF tokens can't be consumed")
     if not user_id or not token:
         return False
 
+    if stateless:
+        # Pure CPU work, no storage lookup
+        return _verify_stateless_token(user_id, token, nonce)
+
     # Get token hash
     token_hash = hashlib.sha256(token.encode()).hexdigest()
 
@@ -48,7 +103,20 @@ def verify_csrf_token(user_id: str, token: str) -> bool:
     storage = manager.token_storage
 
     # Verify token
-    return storage.verify_csrf_token(user_id, token_hash)
+    return storage.verify_csrf_token(user_id, token_hash, consume)
+
+
+async def averify_csrf_token(
+    user_id: str, token: str, consume: bool = False, stateless: bool = False, nonce: str | None = None
+) -> bool:
+    """Verify a CSRF token for a user without blocking the event loop on storage I/O"""
+    if stateless or not user_id or not token:
+        # Nothing to await, stateless tokens never touch storage
+        return verify_csrf_token(user_id, token, consume, stateless, nonce)
+
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    manager = _ensure_token_manager()
+    return await manager.async_token_storage.verify_csrf_token(user_id, token_hash, consume)
 
 
 def clear_old_tokens(user_id: str | None = None, max_age_hours: int = 24) -> None:
@@ -59,8 +127,22 @@ def clear_old_tokens(user_id: str | None = None, max_age_hours: int = 24) -> Non
     storage.clear_old_csrf_tokens(user_id, max_age_hours)
 
 
-def csrf_protection(cookie_name: str = "csrf_token", header_name: str = "X-CSRF-Token") -> Callable:
-    """Dependency for CSRF protection"""
+def csrf_protection(
+    cookie_name: str = "csrf_token",
+    header_name: str = "X-CSRF-Token",
+    single_use: bool = False,
+    stateless: bool = False,
+    nonce_getter: Callable[[Request], str | None] | None = None,
+) -> Callable:
+    """
+    Dependency for CSRF protection, with ``single_use`` each token protects one request.
+
+    With ``stateless`` tokens from ``generate_csrf_token(..., stateless=True)``
+    are checked without touching storage; ``nonce_getter`` returns the session
+    nonce they were bound to.
+    """
+    if stateless and single_use:
+        raise ValueError("Stateless CSRF tokens can't be single use")
 
     async def dependency(
         request: Request,
@@ -71,12 +153,14 @@ def csrf_protection(cookie_name: str = "csrf_token", header_name: str = "X-CSRF-
         if request.method in ["GET", "HEAD", "OPTIONS"]:
             return True
 
-        # Check if authentication was performed
-        if not hasattr(request.state, "user"):
+        # Check if authentication was performed, awaiting a lazy user's verification
+        # instead of letting attribute access block the event loop
+        user = await _authenticate(request) if hasattr(request.state, "user") else None
+        if user is None:
             # No authenticated user, no CSRF check needed
             return True
 
-        user_id = request.state.user.user_id
+        user_id = user.user_id
 
         # For stateless auth, get token from either header or cookie
         token = csrf_header or csrf_cookie
@@ -84,7 +168,8 @@ def csrf_protection(cookie_name: str = "csrf_token", header_name: str = "X-CSRF-
         if not token:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="CSRF token missing")
 
-        if not verify_csrf_token(user_id, token):
+        nonce = nonce_getter(request) if nonce_getter is not None else None
+        if not await averify_csrf_token(user_id, token, consume=single_use, stateless=stateless, nonce=nonce):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid CSRF token")
 
         return True
@@ -1,10 +1,14 @@
 from collections.abc import Callable
+from functools import cache
 
 from fastapi import Depends, HTTPException, Request
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
 
+from .lazy import LazyUser
 from .models import TokenData
-from .token import verify_token
+from .roles import role_catalogue
+from .scopes import parse_scope
+from .token import averify_token
 
 
 def _get_token_from_request(request: Request) -> str | None:
@@ -27,36 +31,82 @@ def _get_token_from_request(request: Request) -> str | None:
     return None
 
 
+_MISSING = object()
+
+# request.state key holding this request's authentication outcome when no user was set
+_AUTH_RESULT = "fastauth_auth_result"
+
+
+async def _authenticate(request: Request) -> TokenData | None:
+    """
+    Authenticate the request once. Every auth dependency shares the outcome,
+    including a failed verification, through request.state.
+    """
+    state = request.state
+    # Check if authentication was already performed by middleware
+    if hasattr(state, "user"):
+        user = state.user
+        if isinstance(user, LazyUser):
+            # Deferred by the middleware, verify now that the route needs it
+            user = await user.resolve()
+            state.user = user
+        return user
+
+    result = getattr(state, _AUTH_RESULT, _MISSING)
+    if result is not _MISSING:
+        if isinstance(result, HTTPException):
+            raise result
+        return result
+
+    token = _get_token_from_request(request)
+    if not token:
+        setattr(state, _AUTH_RESULT, None)
+        return None
+
+    try:
+        token_data = await averify_token(token)
+    except HTTPException as e:
+        setattr(state, _AUTH_RESULT, e)
+        raise
+
+    # Store in request state for future use
+    state.user = token_data
+    return token_data
+
+
 def require_auth(auto_error: bool = True) -> Callable:
-    """Dependency for routes that require authentication"""
+    """
+    Dependency for routes that require authentication.
 
-    async def dependency(request: Request) -> TokenData:
-        # Check if authentication was already performed by middleware
-        if hasattr(request.state, "user"):
-            return request.state.user
-
-        # Try to authenticate
-        token = _get_token_from_request(request)
-        if not token:
-            if auto_error:
-                raise HTTPException(
-                    status_code=HTTP_401_UNAUTHORIZED,
-                    detail="Not authenticated",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-            return None
+    Equal arguments return the same callable, so FastAPI resolves it once per request.
+    """
+    return _require_auth(bool(auto_error))
 
-        # Verify token
-        token_data = verify_token(token)
-        # Store in request state for future use
-        request.state.user = token_data
+
+@cache
+def _require_auth(auto_error: bool) -> Callable:
+    async def dependency(request: Request) -> TokenData:
+        token_data = await _authenticate(request)
+        if token_data is None and auto_error:
+            raise HTTPException(
+                status_code=HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
         return token_data
 
     return dependency
 
 
 def require_role(roles: list[str], require_all: bool = False):
-    """Dependency for routes that require specific role(s)"""
+    """Dependency for routes that require specific role(s), memoized like ``require_auth``"""
+    return _require_role(tuple(roles), bool(require_all))
+
+
+@cache
+def _require_role(roles: tuple[str, ...], require_all: bool):
+    # Compiled once; tokens carry the mask of their roles and the roles those imply
+    required_mask = role_catalogue.required_mask(roles)
 
     async def dependency(token_data: TokenData = Depends(require_auth())) -> TokenData:
         if not token_data:
@@ -66,19 +116,16 @@ def require_role(roles: list[str], require_all: bool = False):
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        user_roles = set(token_data.roles)
-        required_roles = set(roles)
-
         if require_all:
             # User must have all specified roles
-            if not required_roles.issubset(user_roles):
+            if token_data.role_mask & required_mask != required_mask:
                 raise HTTPException(
                     status_code=HTTP_403_FORBIDDEN,
                     detail=f"Insufficient permissions. Required roles: {', '.join(roles)}",
                 )
         else:
             # User must have at least one of the specified roles
-            if not user_roles.intersection(required_roles):
+            if not token_data.role_mask & required_mask:
                 raise HTTPException(
                     status_code=HTTP_403_FORBIDDEN,
                     detail=f"Insufficient permissions. Required one of: {', '.join(roles)}",
@@ -87,3 +134,42 @@ def require_role(roles: list[str], require_all: bool = False):
         return token_data
 
     return dependency
+
+
+def require_scopes(scopes: list[str], require_all: bool = True):
+    """Dependency for routes that require scope(s), memoized like ``require_auth``"""
+    return _require_scopes(tuple(scopes), bool(require_all))
+
+
+@cache
+def _require_scopes(scopes: tuple[str, ...], require_all: bool):
+    # Parsed once; each token's granted scopes are compiled once and cached with it
+    required = tuple(parse_scope(scope) for scope in scopes)
+
+    async def dependency(token_data: TokenData = Depends(require_auth())) -> TokenData:
+        if not token_data:
+            raise HTTPException(
+                status_code=HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        matcher = token_data.scope_matcher
+        if require_all:
+            # Token must grant all specified scopes
+            if not matcher.allows_all(required):
+                raise HTTPException(
+                    status_code=HTTP_403_FORBIDDEN,
+                    detail=f"Insufficient scope. Required scopes: {', '.join(scopes)}",
+                )
+        else:
+            # Token must grant at least one of the specified scopes
+            if not matcher.allows_any(required):
+                raise HTTPException(
+                    status_code=HTTP_403_FORBIDDEN,
+                    detail=f"Insufficient scope. Required one of: {', '.join(scopes)}",
+                )
+
+        return token_data
+
+    return dependency
@@ -0,0 +1,50 @@
+import heapq
+import itertools
+import time
+from collections.abc import Hashable
+
+
+class ExpiryIndex:
+    """
+    Min-heap of (expires_at, key) pairs.
+
+    Removing or replacing an entry doesn't touch the index; callers check
+    each popped key against their own data and ignore stale ones. Popping the
+    expired entries costs O(expired log n) however many live entries there are.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, int, Hashable]] = []
+        # Tie-breaker so keys never need to be comparable
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, expires_at: float, key: Hashable) -> None:
+        """Index a key expiring at ``expires_at``"""
+        heapq.heappush(self._heap, (expires_at, next(self._counter), key))
+
+    def next_expiry(self) -> float | None:
+        """Return the earliest indexed expiry"""
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(
+        self, current_time: float, limit: int | None = None, deadline: float | None = None
+    ) -> list[tuple[float, Hashable]]:
+        """
+        Pop entries expiring at or before ``current_time``.
+
+        Stops after ``limit`` entries or once ``time.perf_counter()`` passes ``deadline``.
+        """
+        expired: list[tuple[float, Hashable]] = []
+        heap = self._heap
+        while heap and heap[0][0] <= current_time:
+            if limit is not None and len(expired) >= limit:
+                break
+            # Checking the clock on every pop would cost more than the pop itself
+            if deadline is not None and len(expired) % 64 == 63 and time.perf_counter() >= deadline:
+                break
+            expires_at, _, key = heapq.heappop(heap)
+            expired.append((expires_at, key))
+        return expired
@@ -0,0 +1,59 @@
+from typing import Any
+
+from fastapi import HTTPException
+
+from .models import TokenData
+from .token import averify_token, verify_token
+
+
+class LazyUser:
+    """
+    Stand-in for ``request.state.user`` installed by ``AuthMiddleware(lazy=True)``.
+
+    The token is only verified once something needs the user: ``require_auth``
+    and the other auth dependencies await ``resolve()``, while reading an
+    attribute such as ``request.state.user.user_id`` verifies synchronously.
+    A failed verification raises the same 401 on every use.
+    """
+
+    __slots__ = ("token", "_token_data", "_error")
+
+    def __init__(self, token: str) -> None:
+        self.token = token
+        self._token_data: Any = None
+        self._error: HTTPException | None = None
+
+    @property
+    def resolved(self) -> bool:
+        return self._token_data is not None or self._error is not None
+
+    async def resolve(self) -> TokenData:
+        """Verify the token, once"""
+        if not self.resolved:
+            try:
+                self._token_data = await averify_token(self.token)
+            except HTTPException as e:
+                self._error = e
+        return self._result()
+
+    def resolve_sync(self) -> TokenData:
+        """Verify the token, once, without awaiting storage"""
+        if not self.resolved:
+            try:
+                self._token_data = verify_token(self.token)
+            except HTTPException as e:
+                self._error = e
+        return self._result()
+
+    def _result(self) -> TokenData:
+        if self._error is not None:
+            raise self._error
+        return self._token_data
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for attributes of the token data, the slots above are always set
+        return getattr(self.resolve_sync(), name)
+
+    def __repr__(self) -> str:
+        state = "resolved" if self.resolved else "pending"
+        return f"<LazyUser {state}>"
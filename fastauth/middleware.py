@@ -1,85 +1,228 @@
-from collections.abc import Awaitable, Callable
-from typing import Any
+import json
+import math
+from collections.abc import Callable
+from urllib.parse import parse_qsl
 
-from fastapi import FastAPI, Request, Response
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.status import HTTP_401_UNAUTHORIZED
+from fastapi import FastAPI, Request
+from starlette.requests import cookie_parser
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_429_TOO_MANY_REQUESTS
+from starlette.types import ASGIApp, Receive, Scope, Send
 
-from .token import verify_token
+from .lazy import LazyUser
+from .paths import PathMatcher
+from .policy import POLICY_ENFORCED, AuthPolicy, PolicyTable
+from .ratelimit import RateLimiter
+from .token import averify_token
+from .utils import looks_like_jwt, token_digest
 
+# Rejections never vary, so they are encoded once instead of per rejected request
+_INVALID_TOKEN_BODY = json.dumps({"detail": "Invalid authentication credentials"}).encode()
+_NOT_AUTHENTICATED_BODY = json.dumps({"detail": "Not authenticated"}).encode()
+_RATE_LIMITED_BODY = json.dumps({"detail": "Too many requests"}).encode()
+
+
+class AuthMiddleware:
+    """
+    Raw ASGI middleware that verifies the request token and stores the
+    resulting ``TokenData`` in ``scope["state"]["user"]`` (``request.state.user``).
+
+    Unlike ``BaseHTTPMiddleware`` it adds no extra task or stream around the
+    response, so streaming responses and background tasks behave as without it.
+
+    Routes declaring an ``AuthPolicy`` are authorized here as well, before
+    routing. The policy table is built at startup and rebuilt if routes are
+    added later.
+
+    With ``lazy=True`` the token is only extracted, and ``request.state.user``
+    is a ``LazyUser`` that verifies it the first time the route needs the user.
+    Routes that never do, like public endpoints or CORS preflights, skip the
+    signature check and storage lookups. Policies still verify up front.
+
+    A ``rate_limiter`` answers authenticated requests over their limit with a
+    429 before they reach the app. They are keyed on the verified ``user_id``
+    or, with ``rate_limit_by="token"`` or in lazy mode, on the token digest.
+    """
 
-class AuthMiddleware(BaseHTTPMiddleware):
     def __init__(
         self,
-        app: FastAPI,
+        app: ASGIApp,
         exclude_paths: list[str] | None = None,
         token_getter: Callable[[Request], str | None] | None = None,
+        lazy: bool = False,
+        rate_limiter: RateLimiter | None = None,
+        rate_limit_by: str = "user",
     ) -> None:
-        super().__init__(app)
-        self.exclude_paths = exclude_paths or []
-        self.token_getter = token_getter or self._default_token_getter
+        if rate_limit_by not in ("user", "token"):
+            raise ValueError("rate_limit_by must be 'user' or 'token'")
+        self.app = app
+        self.exclude_paths = PathMatcher(exclude_paths or [])
+        self.token_getter = token_getter
+        self.lazy = lazy
+        self.rate_limiter = rate_limiter
+        self.rate_limit_by = rate_limit_by
+        self._policy_table: PolicyTable | None = None
+        self._policy_routes: tuple[int, int] | None = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            if scope["type"] == "lifespan":
+                self._get_policy_table(scope)
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Any:
         # Skip authentication for excluded paths
-        path = request.url.path
-        if any(path.startswith(excluded) for excluded in self.exclude_paths):
-            return await call_next(request)
+        if self.exclude_paths and self.exclude_paths.matches(scope["path"]):
+            await self.app(scope, receive, send)
+            return
 
         # Try to get token
-        token = self.token_getter(request)
-
-        # If no token is found, we don't authenticate yet (let the route dependency handle it)
-        if not token:
-            return await call_next(request)
-
-        try:
-            # Verify token and add user info to request state
-            token_data = verify_token(token)
-            request.state.user = token_data
-            return await call_next(request)
-        except Exception:
-            # Authentication failed
-            return JSONResponse(
-                status_code=HTTP_401_UNAUTHORIZED,
-                content={"detail": "Invalid authentication credentials"},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        token = self.token_getter(Request(scope)) if self.token_getter is not None else self._token_from_scope(scope)
+
+        policy_table = self._get_policy_table(scope)
+        policies = (
+            policy_table.lookup(scope["method"], PolicyTable.route_path(scope)) if policy_table is not None else ()
+        )
+
+        # Without a token or a policy, we don't authenticate yet (let the route dependency handle it)
+        if not token and not policies:
+            await self.app(scope, receive, send)
+            return
+
+        # Same dict that backs request.state
+        state = scope.setdefault("state", {})
+
+        # Defer verification until something needs the user, unless a policy needs it now
+        if self.lazy and token and not any(policy.kind != AuthPolicy.PUBLIC for policy in policies):
+            # Nothing is verified yet, so only the token itself can be limited. Garbage
+            # gets no bucket, it would only push out real ones; it fails on first use anyway
+            if (
+                self.rate_limiter is not None
+                and looks_like_jwt(token)
+                and await self._rate_limited(send, token_digest(token).hex())
+            ):
+                return
+            state["user"] = LazyUser(token)
+            if policies:
+                state[POLICY_ENFORCED] = policies
+            await self.app(scope, receive, send)
+            return
+
+        token_data = None
+        if token:
+            try:
+                token_data = await averify_token(token)
+            except Exception:
+                # Authentication failed
+                await self._send_rejection(send, HTTP_401_UNAUTHORIZED, _INVALID_TOKEN_BODY)
+                return
+            state["user"] = token_data
+
+            if self.rate_limiter is not None:
+                key = token_data.user_id if self.rate_limit_by == "user" else token_digest(token).hex()
+                if await self._rate_limited(send, key):
+                    return
+
+        if policies:
+            for policy in policies:
+                status_code = policy.check(token_data)
+                if status_code == HTTP_401_UNAUTHORIZED:
+                    await self._send_rejection(send, status_code, _NOT_AUTHENTICATED_BODY)
+                    return
+                if status_code is not None:
+                    await self._send_rejection(send, status_code, policy.forbidden_body)
+                    return
+            state[POLICY_ENFORCED] = policies
+
+        await self.app(scope, receive, send)
+
+    async def _rate_limited(self, send: Send, key: str) -> bool:
+        """Send a 429 and return True if ``key`` is over its limit"""
+        retry_after = await self.rate_limiter.hit(key)
+        if not retry_after:
+            return False
+
+        await self._send_rejection(
+            send,
+            HTTP_429_TOO_MANY_REQUESTS,
+            _RATE_LIMITED_BODY,
+            [(b"retry-after", str(math.ceil(retry_after)).encode())],
+        )
+        return True
+
+    def _get_policy_table(self, scope: Scope) -> PolicyTable | None:
+        app = scope.get("app")
+        routes = getattr(app, "routes", None)
+        if routes is None:
+            return None
+
+        # Routes may still be added after startup, rebuild when the list changes
+        key = (id(routes), len(routes))
+        if key != self._policy_routes:
+            self._policy_table = PolicyTable(routes)
+            self._policy_routes = key
+        return self._policy_table
 
     @staticmethod
-    def _default_token_getter(request: Request) -> str | None:
+    def _token_from_scope(scope: Scope) -> str | None:
         """
-        Default token getter that tries to extract token from:
+        Default token lookup, reading the raw scope instead of building a Request:
         1. Authorization header (Bearer token)
         2. Cookie named 'access_token'
         3. Query parameter 'access_token'
         """
+        auth_header = cookie_header = None
+        for name, value in scope["headers"]:
+            if name == b"authorization" and auth_header is None:
+                auth_header = value
+            elif name == b"cookie" and cookie_header is None:
+                cookie_header = value
+
         # Try Authorization header
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            return auth_header.replace("Bearer ", "")
+        if auth_header is not None and auth_header.startswith(b"Bearer "):
+            return auth_header[7:].decode("latin-1")
 
         # Try cookie
-        token = request.cookies.get("access_token")
-        if token:
-            return token
+        if cookie_header is not None and b"access_token" in cookie_header:
+            token = cookie_parser(cookie_header.decode("latin-1")).get("access_token")
+            if token:
+                return token
 
         # Try query parameter
-        token = request.query_params.get("access_token")
-        if token:
-            return token
+        query_string = scope.get("query_string", b"")
+        if b"access_token" in query_string:
+            for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True):
+                if name == "access_token":
+                    return value or None
 
         return None
 
+    @staticmethod
+    async def _send_rejection(
+        send: Send, status_code: int, body: bytes, extra_headers: list[tuple[bytes, bytes]] | None = None
+    ) -> None:
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if status_code == HTTP_401_UNAUTHORIZED:
+            headers.append((b"www-authenticate", b"Bearer"))
+        if extra_headers:
+            headers.extend(extra_headers)
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
 
 def register_auth_middleware(
     app: FastAPI,
     exclude_paths: list[str] | None = None,
     token_getter: Callable[[Request], str | None] | None = None,
+    lazy: bool = False,
+    rate_limiter: RateLimiter | None = None,
+    rate_limit_by: str = "user",
 ) -> None:
     """Register the authentication middleware with a FastAPI app"""
     app.add_middleware(
         AuthMiddleware,
         exclude_paths=exclude_paths or ["/docs", "/redoc", "/openapi.json"],
         token_getter=token_getter,
+        lazy=lazy,
+        rate_limiter=rate_limiter,
+        rate_limit_by=rate_limit_by,
     )
@@ -1,4 +1,9 @@
-from pydantic import BaseModel, Field
+from dataclasses import dataclass
+
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
+
+from .roles import role_catalogue
+from .scopes import ScopeMatcher, matcher_for
 
 
 class User(BaseModel):
@@ -8,6 +13,7 @@ class User(BaseModel):
     username: str
     email: str | None = None
     roles: list[str] = Field(default_factory=list)
+    scopes: list[str] = Field(default_factory=list)
 
 
 class TokenData(BaseModel):
@@ -15,6 +21,59 @@ class TokenData(BaseModel):
 
     user_id: str
     roles: list[str] = Field(default_factory=list)
+    # Bits of the roles and the roles they imply, computed once when the token is verified
+    role_mask: int = Field(0, exclude=True, repr=False)
+    scopes: list[str] = Field(default_factory=list)
+    _scope_matcher: ScopeMatcher | None = PrivateAttr(None)
+
+    @model_validator(mode="after")
+    def _compute_role_mask(self) -> "TokenData":
+        if not self.role_mask and self.roles:
+            self.role_mask = role_catalogue.mask(self.roles)
+        return self
+
+    @property
+    def scope_matcher(self) -> ScopeMatcher:
+        """Matcher over the granted scopes, shared by every token granting the same ones"""
+        if self._scope_matcher is None:
+            self._scope_matcher = matcher_for(self.scopes)
+        return self._scope_matcher
+
+
+class _FastTokenDataSlots:
+    # Kept out of the dataclass fields so they never show up when it is serialized
+    __slots__ = ("role_mask", "_scope_matcher")
+
+
+@dataclass(frozen=True, slots=True)
+class FastTokenData(_FastTokenDataSlots):
+    """
+    Slotted stand-in for ``TokenData`` returned by ``TokenManager(fast_token_data=True)``.
+
+    Same attributes, with roles and scopes as tuples. Building it skips
+    pydantic validation, which is redundant for claims whose signature was
+    just checked. Call ``to_model()`` where a pydantic model is required.
+    """
+
+    user_id: str
+    roles: tuple[str, ...] = ()
+    scopes: tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "role_mask", role_catalogue.mask(self.roles) if self.roles else 0)
+        object.__setattr__(self, "_scope_matcher", None)
+
+    @property
+    def scope_matcher(self) -> ScopeMatcher:
+        """Matcher over the granted scopes, shared by every token granting the same ones"""
+        if self._scope_matcher is None:
+            object.__setattr__(self, "_scope_matcher", matcher_for(self.scopes))
+        return self._scope_matcher
+
+    def to_model(self) -> TokenData:
+        return TokenData(
+            user_id=self.user_id, roles=list(self.roles), scopes=list(self.scopes), role_mask=self.role_mask
+        )
 
 
 class TokenResponse(BaseModel):
@@ -0,0 +1,151 @@
+import logging
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from redis import Redis
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class UserStateNearCache:
+    """
+    Process-local cache of user token versions and "all revoked" flags for
+    the Redis storages.
+
+    Storages publish the user id on a Redis pub/sub channel whenever they
+    change that state, and every process drops its cached entry when the
+    message arrives. Revoked tokens are published as digests on a second
+    channel, ``token_channel``, and only passed on to the storages' listeners
+    (e.g. the verified-token cache). Entries also expire after ``ttl`` seconds
+    as a safety net. While the subscription is down the cache is bypassed, so reads go
+    straight to Redis until it is re-established.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        channel: str = "fastauth:invalidate",
+        max_size: int = 10_000,
+        ttl: float = 30.0,
+        resubscribe_interval: float = 5.0,
+    ) -> None:
+        self.redis = redis_client
+        self.channel = channel
+        self.token_channel = f"{channel}:token"
+        self.max_size = max_size
+        self.ttl = ttl
+        self.resubscribe_interval = resubscribe_interval
+        # Called with each (token digest, user id) invalidated by another process
+        self.on_remote_invalidation: list[Callable[[bytes | None, str | None], None]] = []
+        # user_id -> (all_revoked, version)
+        self._cache = TTLCache(max_size, ttl)
+        self._listening = False
+        self._started = False
+        self._thread: Any = None
+        # Retries a failed subscription off the request path
+        self._retry_timer: threading.Timer | None = None
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def generation(self) -> int:
+        """Token to pass back to put(), taken before reading from Redis"""
+        return self._cache.generation
+
+    def start(self) -> None:
+        """Subscribe to the invalidation channels in a background thread"""
+        self._started = True
+        self._subscribe()
+
+    def _subscribe(self) -> None:
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._handle_message, self.token_channel: self._handle_token_message})
+            self._thread = pubsub.run_in_thread(
+                sleep_time=1.0, daemon=True, exception_handler=self._handle_subscription_error
+            )
+        except Exception:
+            logger.warning("Could not subscribe to %s, reading token versions from Redis", self.channel, exc_info=True)
+            self._schedule_resubscribe()
+            return
+
+        self._listening = True
+
+    def _schedule_resubscribe(self) -> None:
+        # Connecting can block for the whole socket timeout, so never do it while serving a read
+        if not self._started:
+            return
+        self._retry_timer = threading.Timer(self.resubscribe_interval, self._resubscribe)
+        self._retry_timer.daemon = True
+        self._retry_timer.start()
+
+    def _resubscribe(self) -> None:
+        self._retry_timer = None
+        if self._started and not self._listening:
+            self._subscribe()
+
+    def stop(self) -> None:
+        """Stop listening for invalidations and drop every cached entry"""
+        self._started = False
+        self._listening = False
+        if self._retry_timer is not None:
+            self._retry_timer.cancel()
+            self._retry_timer = None
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+        self.clear()
+
+    def enabled(self) -> bool:
+        """Whether cached entries can be trusted, i.e. the subscription is up"""
+        return self._listening
+
+    def get(self, user_id: str) -> tuple[bool, int] | None:
+        """Return the cached (all revoked, version) for a user"""
+        if not self.enabled():
+            return None
+        state: tuple[bool, int] | None = self._cache.get(user_id)
+        return state
+
+    def put(self, user_id: str, all_revoked: bool, version: int, generation: int) -> None:
+        """Cache a user's state unless it was invalidated since ``generation`` was read"""
+        if self._listening:
+            self._cache.set(user_id, (all_revoked, version), self.ttl, generation)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's entry in this process"""
+        self._cache.invalidate(keys=(user_id,))
+
+    def clear(self) -> None:
+        """Drop every entry in this process"""
+        self._cache.clear()
+
+    def _handle_message(self, message: dict[str, Any]) -> None:
+        data = message.get("data")
+        user_id = data.decode() if isinstance(data, bytes) else str(data)
+        self.invalidate(user_id)
+        for callback in self.on_remote_invalidation:
+            callback(None, user_id)
+
+    def _handle_token_message(self, message: dict[str, Any]) -> None:
+        data = message.get("data")
+        try:
+            digest = bytes.fromhex(data.decode() if isinstance(data, bytes) else str(data))
+        except ValueError:
+            logger.warning("Ignoring malformed message on %s", self.token_channel)
+            return
+        for callback in self.on_remote_invalidation:
+            callback(digest, None)
+
+    def _handle_subscription_error(self, error: BaseException, pubsub: Any, thread: Any) -> None:
+        # Messages may have been missed, so nothing cached can be trusted any more
+        logger.warning("Lost subscription to %s, reading token versions from Redis: %s", self.channel, error)
+        self._listening = False
+        self._thread = None
+        thread.stop()
+        self.clear()
+        self._schedule_resubscribe()
@@ -0,0 +1,80 @@
+import fnmatch
+import re
+from collections.abc import Iterable
+from typing import Any
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+# Trie node keys for a prefix ending there, and for the globs whose literal part ends there
+_END = ""
+_GLOBS = None
+
+
+class PathMatcher:
+    """
+    Matches request paths against a fixed set of patterns, compiled once.
+
+    - ``"/static"``: prefix, matches any path starting with it
+    - ``"=/health"``: exact path only
+    - ``"/webhooks/*/events"``: glob over the whole path (``*``, ``?``, ``[...]``)
+
+    Prefixes live in a character trie, so a lookup walks at most the length
+    of the longest prefix. Globs hang off the trie node for their literal
+    leading part, and only the globs whose leading part matches the path are
+    tried. Exact paths are a set lookup.
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()) -> None:
+        self.patterns = list(patterns)
+        self._trie: dict[str | None, Any] = {}
+        self._exact: set[str] = set()
+
+        for pattern in self.patterns:
+            if pattern.startswith("="):
+                self._exact.add(pattern[1:])
+                continue
+
+            glob = _GLOB_CHARS.search(pattern)
+            node = self._trie
+            for char in pattern[: glob.start()] if glob else pattern:
+                node = node.setdefault(char, {})
+            if glob:
+                node.setdefault(_GLOBS, []).append(f"(?:{fnmatch.translate(pattern)})")
+            else:
+                node[_END] = True
+
+        self._compile_globs(self._trie)
+
+    @classmethod
+    def _compile_globs(cls, node: dict[str | None, Any]) -> None:
+        # Globs sharing a leading part are tried with one regex
+        for key, child in node.items():
+            if key is _GLOBS:
+                node[_GLOBS] = re.compile("|".join(child))
+            elif key != _END:
+                cls._compile_globs(child)
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def matches(self, path: str) -> bool:
+        """Return True if ``path`` matches any configured pattern"""
+        if path in self._exact:
+            return True
+
+        node = self._trie
+        for char in path:
+            # Most nodes are plain trie steps, only call out for the ones that end a pattern
+            if (_END in node or _GLOBS in node) and self._matches_node(node, path):
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+
+        return self._matches_node(node, path)
+
+    @staticmethod
+    def _matches_node(node: dict[str | None, Any], path: str) -> bool:
+        if _END in node:
+            return True
+        globs = node.get(_GLOBS)
+        return globs is not None and globs.match(path) is not None
@@ -0,0 +1,169 @@
+import json
+import re
+from collections.abc import Iterable
+
+from fastapi import HTTPException, Request
+from starlette.routing import Host, Mount, Route
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
+from starlette.types import Scope
+
+from .dependencies import _authenticate
+from .models import TokenData
+from .roles import role_catalogue
+
+# request.state key holding the policies the middleware enforced before routing
+POLICY_ENFORCED = "fastauth_policy_enforced"
+
+# Hosts route on the Host header, which the table doesn't see, so they may take any path
+_ANY_PATH = re.compile(".*")
+
+
+class AuthPolicy:
+    """
+    Authorization policy declared on a route or router:
+
+        @app.get("/admin", dependencies=[Depends(AuthPolicy.roles(["admin"]))])
+        router = APIRouter(dependencies=[Depends(AuthPolicy.authenticated())])
+
+    With ``AuthMiddleware`` installed, the policies of every route are compiled
+    into a lookup table and enforced before routing, so unauthorized requests
+    never reach body parsing or other dependencies. Without it, the policy
+    runs as an ordinary dependency. Router and route policies all apply.
+    """
+
+    PUBLIC = "public"
+    AUTHENTICATED = "authenticated"
+    ROLES = "roles"
+
+    def __init__(self, kind: str, roles: Iterable[str] = (), require_all: bool = False) -> None:
+        self.kind = kind
+        self.roles = tuple(roles)
+        self.require_all = require_all
+        self._required_mask = role_catalogue.required_mask(self.roles)
+
+        # Rejections are fixed per policy, so their bodies are built up front
+        if require_all:
+            self.forbidden_detail = f"Insufficient permissions. Required roles: {', '.join(self.roles)}"
+        else:
+            self.forbidden_detail = f"Insufficient permissions. Required one of: {', '.join(self.roles)}"
+        self.forbidden_body = json.dumps({"detail": self.forbidden_detail}).encode()
+
+    @classmethod
+    def public(cls) -> "AuthPolicy":
+        """Anyone may call the route"""
+        return cls(cls.PUBLIC)
+
+    @classmethod
+    def authenticated(cls) -> "AuthPolicy":
+        """Any valid token may call the route"""
+        return cls(cls.AUTHENTICATED)
+
+    @classmethod
+    def roles(cls, roles: Iterable[str], require_all: bool = False) -> "AuthPolicy":
+        """Tokens holding one of ``roles``, or all of them with ``require_all``, may call the route"""
+        return cls(cls.ROLES, roles, require_all)
+
+    def __repr__(self) -> str:
+        if self.kind == self.ROLES:
+            return f"AuthPolicy.roles({list(self.roles)!r}, require_all={self.require_all})"
+        return f"AuthPolicy.{self.kind}()"
+
+    def check(self, token_data: TokenData | None) -> int | None:
+        """Return the status code to reject with, or None if the request is allowed"""
+        if self.kind == self.PUBLIC:
+            return None
+        if token_data is None:
+            return HTTP_401_UNAUTHORIZED
+        if self.kind == self.AUTHENTICATED:
+            return None
+
+        granted = token_data.role_mask & self._required_mask
+        allowed = granted == self._required_mask if self.require_all else granted
+        return None if allowed else HTTP_403_FORBIDDEN
+
+    async def __call__(self, request: Request) -> TokenData | None:
+        # Already enforced before routing. Only this policy counts: the middleware
+        # may have matched a different route than the one being served
+        if any(policy is self for policy in getattr(request.state, POLICY_ENFORCED, ())):
+            return getattr(request.state, "user", None)
+
+        token_data = await _authenticate(request) if self.kind != self.PUBLIC else None
+
+        status_code = self.check(token_data)
+        if status_code == HTTP_401_UNAUTHORIZED:
+            raise HTTPException(
+                status_code=HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        if status_code == HTTP_403_FORBIDDEN:
+            raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail=self.forbidden_detail)
+
+        return token_data
+
+
+def _route_policies(route: Route) -> tuple[AuthPolicy, ...]:
+    # Router dependencies are copied onto each route by include_router
+    return tuple(
+        depends.dependency
+        for depends in getattr(route, "dependencies", ())
+        if isinstance(depends.dependency, AuthPolicy)
+    )
+
+
+class PolicyTable:
+    """
+    Route policies compiled from an app's routes.
+
+    A path without parameters resolves with one dict lookup keyed by
+    (method, path); shadowing by an earlier parameterized route is resolved
+    when the table is built. Other paths are tried in route order against the
+    parameterized routes' regexes, the way the router would match them.
+
+    Mounted apps and hosts route on their own: a path one of them would take
+    first gets no policies, so route dependencies enforce them instead.
+    """
+
+    def __init__(self, routes: Iterable) -> None:
+        self._static: dict[tuple[str, str], tuple[AuthPolicy, ...]] = {}
+        self._dynamic: list[tuple[re.Pattern, frozenset[str] | None, tuple[AuthPolicy, ...]]] = []
+
+        for route in routes:
+            if isinstance(route, Mount | Host):
+                self._dynamic.append((route.path_regex if isinstance(route, Mount) else _ANY_PATH, None, ()))
+                continue
+            if not isinstance(route, Route):
+                continue
+            policies = _route_policies(route)
+            methods = frozenset(route.methods) if route.methods is not None else None
+
+            if route.param_convertors or methods is None:
+                self._dynamic.append((route.path_regex, methods, policies))
+                continue
+
+            for method in methods:
+                # The first matching route wins, like the router
+                if (method, route.path) not in self._static:
+                    self._static[(method, route.path)] = self._match_dynamic(method, route.path, default=policies)
+
+    def _match_dynamic(self, method: str, path: str, default: tuple[AuthPolicy, ...] = ()) -> tuple[AuthPolicy, ...]:
+        for regex, methods, policies in self._dynamic:
+            if (methods is None or method in methods) and regex.match(path):
+                return policies
+        return default
+
+    def lookup(self, method: str, path: str) -> tuple[AuthPolicy, ...]:
+        """Return the policies of the route serving ``method`` and ``path``"""
+        policies = self._static.get((method, path))
+        if policies is not None:
+            return policies
+        return self._match_dynamic(method, path)
+
+    @staticmethod
+    def route_path(scope: Scope) -> str:
+        """The path the router matches on, without the mount prefix"""
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            return path[len(root_path) :]
+        return path
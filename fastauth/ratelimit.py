@@ -0,0 +1,140 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any
+
+
+def take_token(
+    state: tuple[float, float] | None, now: float, rate: float, burst: int
+) -> tuple[tuple[float, float], float]:
+    """
+    Token-bucket step shared by the backends: refill the bucket for the time
+    elapsed since ``state`` and take one token.
+
+    Returns the new ``(tokens, updated_at)`` state and the seconds to wait
+    before retrying, 0.0 if the request is allowed.
+    """
+    if state is None:
+        tokens = float(burst)
+    else:
+        tokens, updated_at = state
+        tokens = min(float(burst), tokens + max(0.0, now - updated_at) * rate)
+
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class RateLimiter(ABC):
+    """
+    Token-bucket rate limiter: each key may make ``burst`` requests at once,
+    refilled at ``rate`` requests per second.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+
+    @abstractmethod
+    async def hit(self, key: str) -> float:
+        """Count a request for ``key``, returning 0.0 if allowed or the seconds until it would be"""
+        pass
+
+
+# Fraction of a shard's share of max_keys left after pruning
+_PRUNE_LOW_WATER = 0.9
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    In-process limiter. Buckets are spread over ``shards`` dicts, each with its
+    own lock, so concurrent threads rarely wait on each other. A shard holding
+    more than its share of ``max_keys`` drops buckets that have refilled, then
+    the least recently used ones, down to 90% of its share so the scan is paid
+    once per many new keys rather than on every one.
+    """
+
+    def __init__(self, rate: float, burst: int, shards: int = 16, max_keys: int = 100_000) -> None:
+        super().__init__(rate, burst)
+        self._shards: list[tuple[dict[str, tuple[float, float]], threading.Lock]] = [
+            ({}, threading.Lock()) for _ in range(shards)
+        ]
+        self._max_keys_per_shard = max(1, max_keys // shards)
+        self._prune_to = max(1, int(self._max_keys_per_shard * _PRUNE_LOW_WATER))
+
+    async def hit(self, key: str) -> float:
+        # Never blocks on I/O, so there is nothing to await
+        return self.hit_sync(key)
+
+    def hit_sync(self, key: str) -> float:
+        buckets, lock = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            # Re-inserted so the dict stays ordered from least to most recently used
+            state, retry_after = take_token(buckets.pop(key, None), now, self.rate, self.burst)
+            buckets[key] = state
+            if len(buckets) > self._max_keys_per_shard:
+                self._prune(buckets, now)
+        return retry_after
+
+    def _prune(self, buckets: dict[str, tuple[float, float]], now: float) -> None:
+        # A refilled bucket behaves exactly like a missing one
+        for key in [
+            key
+            for key, (tokens, updated_at) in buckets.items()
+            if tokens + (now - updated_at) * self.rate >= self.burst
+        ]:
+            del buckets[key]
+
+        # Still too many active keys, forget the least recently used ones
+        excess = len(buckets) - self._prune_to
+        if excess > 0:
+            for key in list(buckets)[:excess]:
+                del buckets[key]
+
+
+# Same steps as take_token. Lua numbers lose their fraction when returned, so the wait comes back as a string
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+if tokens == nil then
+    tokens = burst
+else
+    tokens = math.min(burst, tokens + math.max(0, now - tonumber(state[2])) * rate)
+end
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Limiter shared by every process, for a ``redis.asyncio`` client. Each hit
+    is one atomic script call; buckets expire once they would have refilled.
+    """
+
+    def __init__(self, redis_client: Any, rate: float, burst: int, prefix: str = "fastauth:ratelimit:") -> None:
+        super().__init__(rate, burst)
+        self.redis = redis_client
+        self.prefix = prefix
+        self._script = redis_client.register_script(_TOKEN_BUCKET_SCRIPT)
+        self._expire_ms = math.ceil(burst / rate * 1000)
+
+    async def hit(self, key: str) -> float:
+        retry_after = await self._script(
+            keys=[f"{self.prefix}{key}"], args=[self.rate, self.burst, time.time(), self._expire_ms]
+        )
+        return float(retry_after)
@@ -0,0 +1,73 @@
+import threading
+from collections.abc import Iterable
+
+
+class RoleCatalogue:
+    """
+    Assigns every role a bit, so role sets become integer masks.
+
+    A role may imply others ("admin" implies "user"); a token's mask carries
+    the bits of its roles and of everything they imply, so checks are a
+    single AND. Roles that were never registered get a bit the first time
+    they are seen. Register hierarchies at startup, before tokens are verified:
+    masks already computed are not revisited.
+    """
+
+    def __init__(self) -> None:
+        self._bits: dict[str, int] = {}
+        self._implies: dict[str, frozenset[str]] = {}
+        # Expanded mask per role set, users mostly share a handful of them
+        self._masks: dict[tuple[str, ...], int] = {}
+        self._lock = threading.Lock()
+
+    def register(self, role: str, implies: Iterable[str] = ()) -> int:
+        """Register a role and the roles it implies, returning its bit"""
+        with self._lock:
+            self._implies[role] = self._implies.get(role, frozenset()) | frozenset(implies)
+            self._masks.clear()
+        for implied in self._implies[role]:
+            self.bit(implied)
+        return self.bit(role)
+
+    def bit(self, role: str) -> int:
+        """Return the bit of a role, assigning one if it is new"""
+        bit = self._bits.get(role)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.setdefault(role, 1 << len(self._bits))
+        return bit
+
+    def required_mask(self, roles: Iterable[str]) -> int:
+        """Mask of exactly these roles, for compiling a requirement"""
+        mask = 0
+        for role in roles:
+            mask |= self.bit(role)
+        return mask
+
+    def mask(self, roles: Iterable[str]) -> int:
+        """Mask of these roles and every role they imply, for a token"""
+        key = tuple(roles)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self.required_mask(self._expand(key))
+            self._masks[key] = mask
+        return mask
+
+    def _expand(self, roles: Iterable[str]) -> set[str]:
+        expanded: set[str] = set()
+        pending = list(roles)
+        while pending:
+            role = pending.pop()
+            if role not in expanded:
+                expanded.add(role)
+                pending.extend(self._implies.get(role, ()))
+        return expanded
+
+
+# Catalogue used by TokenData, require_role and AuthPolicy
+role_catalogue = RoleCatalogue()
+
+
+def register_role(role: str, implies: Iterable[str] = ()) -> int:
+    """Register a role in the default catalogue, e.g. ``register_role("admin", implies=["user"])``"""
+    return role_catalogue.register(role, implies)
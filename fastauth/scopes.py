@@ -0,0 +1,70 @@
+from collections.abc import Iterable
+from functools import lru_cache
+
+SEPARATOR = ":"
+WILDCARD = "*"
+# Distinct scope sets kept compiled; tokens mostly share a handful of them
+MATCHER_CACHE_SIZE = 1024
+# Trie node key marking a granted scope that ends at that node
+_END = ""
+
+
+def parse_scope(scope: str) -> tuple[str, ...]:
+    """Split a scope such as ``orders:read`` into its segments"""
+    return tuple(scope.split(SEPARATOR))
+
+
+class ScopeMatcher:
+    """
+    Granted scopes compiled into a trie over their ``:``-separated segments.
+
+    A ``*`` segment matches any single segment, and a trailing ``*`` matches
+    everything below it: ``orders:*`` grants ``orders:read`` and
+    ``orders:items:write``. Checking a scope walks its segments, so the cost
+    does not depend on how many scopes were granted.
+    """
+
+    def __init__(self, scopes: Iterable[str]) -> None:
+        self._root: dict[str, dict] = {}
+        for scope in scopes:
+            node = self._root
+            for segment in parse_scope(scope):
+                node = node.setdefault(segment, {})
+            node[_END] = {}
+
+    def allows(self, scope: str | tuple[str, ...]) -> bool:
+        """Return True if ``scope`` is granted"""
+        segments = parse_scope(scope) if isinstance(scope, str) else scope
+        return self._allows(self._root, segments, 0)
+
+    def _allows(self, node: dict[str, dict], segments: tuple[str, ...], index: int) -> bool:
+        if index == len(segments):
+            return _END in node
+
+        child = node.get(segments[index])
+        if child is not None and self._allows(child, segments, index + 1):
+            return True
+
+        wildcard = node.get(WILDCARD)
+        if wildcard is None:
+            return False
+        # A trailing wildcard grants the whole subtree
+        if _END in wildcard:
+            return True
+        return self._allows(wildcard, segments, index + 1)
+
+    def allows_all(self, scopes: Iterable[str | tuple[str, ...]]) -> bool:
+        return all(self.allows(scope) for scope in scopes)
+
+    def allows_any(self, scopes: Iterable[str | tuple[str, ...]]) -> bool:
+        return any(self.allows(scope) for scope in scopes)
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def _matcher(scopes: tuple[str, ...]) -> ScopeMatcher:
+    return ScopeMatcher(scopes)
+
+
+def matcher_for(scopes: Iterable[str]) -> ScopeMatcher:
+    """Shared matcher for a set of granted scopes, compiled once per distinct set"""
+    return _matcher(tuple(scopes))
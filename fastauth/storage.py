@@ -1,17 +1,48 @@
-import json
+import math
+import re
 import time
 from abc import ABC, abstractmethod
-from datetime import UTC, datetime
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from datetime import datetime
 from typing import Any
 
 from redis import Redis
 
+from .expiry import ExpiryIndex
+from .near_cache import UserStateNearCache
+from .utils import TOKEN_DIGEST_SIZE, token_digest
+
+# How long to keep a revocation whose token expiry is unknown, in seconds
+DEFAULT_REVOCATION_TTL = 3600
+
+# Called with (token digest, user_id) whenever stored state invalidates a token or all of a user's tokens.
+# Digests rather than tokens, so revocations announced by other processes can be passed on too.
+InvalidationListener = Callable[[bytes | None, str | None], None]
+
+
+class InvalidationNotifier:
+    """Lets caches subscribe to revocation and token version changes"""
+
+    def add_invalidation_listener(self, listener: InvalidationListener) -> None:
+        """Register a callback fired when a token or a user's tokens are invalidated"""
+        if not hasattr(self, "_invalidation_listeners"):
+            self._invalidation_listeners: list[InvalidationListener] = []
+        self._invalidation_listeners.append(listener)
+
+    def _notify_invalidation(self, digest: bytes | None = None, user_id: str | None = None) -> None:
+        for listener in getattr(self, "_invalidation_listeners", ()):
+            listener(digest, user_id)
+
 
 # Abstract base class for token storage implementations
-class TokenStorage(ABC):
+class TokenStorage(InvalidationNotifier, ABC):
+    # Whether calls block on network or disk I/O; async callers run such storage in a worker thread
+    performs_io: bool = True
+
     @abstractmethod
-    def add_revoked_token(self, token: str, user_id: str | None = None) -> None:
-        """Add a token to the revocation list"""
+    def add_revoked_token(self, token: str, user_id: str | None = None, expires_at: float | None = None) -> None:
+        """Add a token to the revocation list until ``expires_at``, the token's own exp timestamp"""
         pass
 
     @abstractmethod
@@ -39,6 +70,18 @@ class TokenStorage(ABC):
         """Increment and return the user's token version"""
         pass
 
+    def get_user_token_versions(self, user_ids: list[str]) -> dict[str, int]:
+        """Get the current token versions for many users"""
+        return {user_id: self.get_user_token_version(user_id) for user_id in user_ids}
+
+    def get_token_state(self, token: str, user_id: str | None = None) -> tuple[bool, int]:
+        """Get whether a token is revoked together with its user's current token version"""
+        return self.is_token_revoked(token, user_id), self.get_user_token_version(user_id) if user_id else 0
+
+    def get_token_states(self, tokens: list[tuple[str, str | None]]) -> list[tuple[bool, int]]:
+        """Get (revoked, current user token version) for many (token, user_id) pairs"""
+        return [self.get_token_state(token, user_id) for token, user_id in tokens]
+
     # CSRF token methods
     @abstractmethod
     def store_csrf_token(self, user_id: str, token_hash: str, expires_at: datetime) -> None:
@@ -46,8 +89,8 @@ class TokenStorage(ABC):
         pass
 
     @abstractmethod
-    def verify_csrf_token(self, user_id: str, token_hash: str) -> bool:
-        """Verify a CSRF token exists and is valid"""
+    def verify_csrf_token(self, user_id: str, token_hash: str, consume: bool = False) -> bool:
+        """Verify a CSRF token exists, is valid and unused, marking it used if ``consume``"""
         pass
 
     @abstractmethod
@@ -58,41 +101,83 @@ class TokenStorage(ABC):
 
 # Memory-based implementation (our current approach)
 class MemoryTokenStorage(TokenStorage):
-    def __init__(self) -> None:
-        self._revoked_tokens: set[str] = set()
-        self._revoked_for_user: dict[str, set[str]] = {}
+    """
+    In-process storage.
+
+    Revocations are kept in an expiry index, so expired entries are found
+    without scanning live ones. Each revocation also drops a couple of expired
+    entries, and explicit sweeps stop after ``sweep_budget`` seconds; a sweep
+    that runs out of budget resumes on the next call.
+
+    Each user keeps at most ``csrf_tokens_per_user`` CSRF tokens, oldest first:
+    storing another one evicts the oldest and drops expired ones from the
+    front, in constant time and without touching the revocation index. Sweeps
+    also walk the users, so tokens of idle users expire too.
+    """
+
+    performs_io = False
+
+    # Expired entries dropped by every write, enough to outpace the insertion rate
+    _SWEEP_ON_WRITE = 2
+
+    def __init__(self, sweep_budget: float = 0.005, csrf_tokens_per_user: int = 16) -> None:
+        if csrf_tokens_per_user < 1:
+            raise ValueError("csrf_tokens_per_user must be at least 1")
+        self.sweep_budget = sweep_budget
+        self.csrf_tokens_per_user = csrf_tokens_per_user
+        # Revoked token digest -> expiry timestamp, digests are much smaller than full JWTs
+        self._revoked_tokens: dict[bytes, float] = {}
+        self._all_revoked_users: set[str] = set()
         self._token_versions: dict[str, int] = {}
-        self._csrf_tokens: dict[str, dict[str, Any]] = {}
-
-    def add_revoked_token(self, token: str, user_id: str | None = None) -> None:
-        self._revoked_tokens.add(token)
-        if user_id:
-            if user_id not in self._revoked_for_user:
-                self._revoked_for_user[user_id] = set()
-            self._revoked_for_user[user_id].add(token)
+        # User -> token hash -> expiry timestamp, oldest first; users in sweep order
+        self._csrf_tokens: OrderedDict[str, OrderedDict[str, float]] = OrderedDict()
+        self._expiry = ExpiryIndex()
+
+    def add_revoked_token(self, token: str, user_id: str | None = None, expires_at: float | None = None) -> None:
+        if expires_at is None:
+            expires_at = time.time() + DEFAULT_REVOCATION_TTL
+        digest = token_digest(token)
+        self._revoked_tokens[digest] = expires_at
+        self._expiry.add(expires_at, ("revoked", digest))
+        self._sweep(time.time(), limit=self._SWEEP_ON_WRITE)
+        self._notify_invalidation(digest, user_id)
 
     def revoke_all_user_tokens(self, user_id: str) -> None:
-        self._revoked_for_user[str(user_id)] = set()
+        self._all_revoked_users.add(str(user_id))
         # Increment token version to invalidate all tokens
         self.increment_user_token_version(user_id)
 
     def is_token_revoked(self, token: str, user_id: str | None = None) -> bool:
-        if token in self._revoked_tokens:
+        # Entries past their expiry are gone, the token itself has expired by then
+        expires_at = self._revoked_tokens.get(token_digest(token))
+        if expires_at is not None and expires_at > time.time():
             return True
 
-        if user_id and user_id in self._revoked_for_user:
-            # If user has an empty set, all their tokens are revoked
-            if not self._revoked_for_user[user_id]:
-                return True
-
-            # Otherwise check if this specific token is revoked
-            return token in self._revoked_for_user[user_id]
-
-        return False
+        return bool(user_id) and user_id in self._all_revoked_users
 
     def clear_expired_tokens(self, current_time: float) -> None:
-        # Nothing to do for memory storage as we handle this in the token service
-        pass
+        deadline = time.perf_counter() + self.sweep_budget
+        self._sweep(current_time, deadline=deadline)
+        self._sweep_csrf(current_time, deadline)
+
+    def _sweep(self, current_time: float, limit: int | None = None, deadline: float | None = None) -> None:
+        """Drop expired revocations, within a count or time budget"""
+        for expires_at, (_, digest) in self._expiry.pop_expired(current_time, limit=limit, deadline=deadline):
+            # Skip index entries superseded by a later revocation of the same token
+            if self._revoked_tokens.get(digest) == expires_at:
+                del self._revoked_tokens[digest]
+
+    def _sweep_csrf(self, current_time: float, deadline: float) -> None:
+        """Drop expired CSRF tokens user by user, resuming where the last sweep ran out of time"""
+        for _ in range(len(self._csrf_tokens)):
+            if time.perf_counter() >= deadline:
+                break
+            # Swept users go to the back, so the next sweep starts with the ones skipped
+            user_id, tokens = self._csrf_tokens.popitem(last=False)
+            for token_hash in [token_hash for token_hash, expiry in tokens.items() if expiry <= current_time]:
+                del tokens[token_hash]
+            if tokens:
+                self._csrf_tokens[user_id] = tokens
 
     def get_user_token_version(self, user_id: str) -> int:
         return self._token_versions.get(user_id, 0)
@@ -101,176 +186,437 @@ class MemoryTokenStorage(TokenStorage):
         current = self._token_versions.get(user_id, 0)
         new_version = current + 1
         self._token_versions[user_id] = new_version
+        self._notify_invalidation(user_id=user_id)
         return new_version
 
     def store_csrf_token(self, user_id: str, token_hash: str, expires_at: datetime) -> None:
-        if user_id not in self._csrf_tokens:
-            self._csrf_tokens[user_id] = {}
-
-        self._csrf_tokens[user_id][token_hash] = {"expires_at": expires_at, "used": False}
+        tokens = self._csrf_tokens.get(user_id)
+        if tokens is None:
+            tokens = self._csrf_tokens[user_id] = OrderedDict()
+
+        tokens[token_hash] = expires_at.timestamp()
+        tokens.move_to_end(token_hash)
+        if len(tokens) > self.csrf_tokens_per_user:
+            tokens.popitem(last=False)
+
+        # Tokens mostly share one lifetime, so the expired ones sit at the front
+        now = time.time()
+        while next(iter(tokens.values())) <= now:
+            tokens.popitem(last=False)
+            if not tokens:
+                del self._csrf_tokens[user_id]
+                break
 
-    def verify_csrf_token(self, user_id: str, token_hash: str) -> bool:
-        if user_id not in self._csrf_tokens:
+    def verify_csrf_token(self, user_id: str, token_hash: str, consume: bool = False) -> bool:
+        tokens = self._csrf_tokens.get(user_id)
+        if tokens is None:
             return False
 
-        if token_hash not in self._csrf_tokens[user_id]:
+        expires_at = tokens.get(token_hash)
+        if expires_at is None:
             return False
 
-        token_data = self._csrf_tokens[user_id][token_hash]
+        # Expired tokens are dropped, consumed ones too so they can't be replayed
+        expired = expires_at < time.time()
+        if expired or consume:
+            del tokens[token_hash]
+            if not tokens:
+                del self._csrf_tokens[user_id]
+        return not expired
 
-        # Check if expired
-        if token_data["expires_at"] < datetime.now(UTC):
-            # Clean up this token
-            del self._csrf_tokens[user_id][token_hash]
-            return False
+    def clear_old_csrf_tokens(self, user_id: str | None = None, max_age_hours: int = 24) -> None:
+        # Used tokens are removed when consumed, so only expired ones are left to drop
+        self._sweep_csrf(time.time(), time.perf_counter() + self.sweep_budget)
 
-        return True
 
-    def clear_old_csrf_tokens(self, user_id: str | None = None, max_age_hours: int = 24) -> None:
-        now = datetime.now(UTC)
+_DIGEST_KEY_RE = re.compile(f"[0-9a-f]{{{TOKEN_DIGEST_SIZE * 2}}}")
 
-        if user_id:
-            # Clear for specific user
-            if user_id in self._csrf_tokens:
-                to_remove = []
-                for token_hash, data in self._csrf_tokens[user_id].items():
-                    if data["expires_at"] < now or data["used"]:
-                        to_remove.append(token_hash)
-
-                for token_hash in to_remove:
-                    del self._csrf_tokens[user_id][token_hash]
-
-                # If user has no more tokens, remove the user entry
-                if not self._csrf_tokens[user_id]:
-                    del self._csrf_tokens[user_id]
-        else:
-            # Clear for all users
-            users_to_remove = []
-            for user_id, tokens in self._csrf_tokens.items():
-                to_remove = []
-                for token_hash, data in tokens.items():
-                    if data["expires_at"] < now or data["used"]:
-                        to_remove.append(token_hash)
-
-                for token_hash in to_remove:
-                    del self._csrf_tokens[user_id][token_hash]
-
-                # If user has no more tokens, mark for removal
-                if not self._csrf_tokens[user_id]:
-                    users_to_remove.append(user_id)
-
-            # Remove empty user entries
-            for user_id in users_to_remove:
-                del self._csrf_tokens[user_id]
 
+class RedisKeyspace:
+    """Key layout shared by the sync and async Redis storages"""
 
-# Redis-based implementation
-class RedisTokenStorage(TokenStorage):
-    def __init__(self, redis_client: Redis, prefix: str = "fastauth:") -> None:
-        self.redis = redis_client
-        self.prefix = prefix
+    prefix: str
+    near_cache: UserStateNearCache | None = None
+    # Also honour revocations stored under full tokens, see RedisTokenStorage.migrate_revocation_keys
+    legacy_revocation_keys: bool = False
 
     def _key(self, *parts: str) -> str:
         return f"{self.prefix}{''.join(parts)}"
 
-    def add_revoked_token(self, token: str, user_id: str | None = None) -> None:
-        # Get token expiration if possible
-        try:
-            payload = json.loads(self.redis.get(self._key("token_payload:", token)) or "{}")
-            exp = payload.get("exp", int(time.time()) + 3600)  # Default 1 hour if no exp
-        except Exception:
-            # If we can't parse, use 1 hour expiration
-            exp = int(time.time()) + 3600
+    @staticmethod
+    def _revocation_ttl(expires_at: float | None) -> int:
+        """Seconds a revocation must be kept for, entries expire together with their token"""
+        if expires_at is None:
+            return DEFAULT_REVOCATION_TTL
+        return math.ceil(expires_at - time.time())
+
+    def _revoked_key(self, token: str) -> str:
+        # Keyed by a fixed-size digest, a full JWT is often 300-600 bytes
+        return self._key("revoked:", token_digest(token).hex())
+
+    def _queue_token_revocation(self, pipe: Any, token: str, user_id: str | None) -> None:
+        """Queue the lookups telling whether a specific token was revoked"""
+        pipe.exists(self._revoked_key(token))
+        if self.legacy_revocation_keys:
+            pipe.exists(self._key("revoked:", token))
+            if user_id:
+                pipe.sismember(self._key("user_revoked:", user_id), token)
+
+    def _queue_user_state(self, pipe: Any, user_id: str) -> None:
+        """Queue the lookups for a user's "all revoked" flag and token version"""
+        pipe.exists(self._key("user_all_revoked:", user_id))
+        pipe.get(self._key("token_version:", user_id))
+
+    def _queue_token_state(self, pipe: Any, token: str, user_id: str | None) -> None:
+        """Queue the lookups needed to resolve a token's revocation and version state"""
+        self._queue_token_revocation(pipe, token, user_id)
+        if user_id:
+            self._queue_user_state(pipe, user_id)
+
+    def _read_token_revocation(self, replies: Iterator[Any], user_id: str | None) -> bool:
+        """Consume the replies queued by _queue_token_revocation"""
+        revoked = bool(next(replies))
+        if self.legacy_revocation_keys:
+            revoked = bool(next(replies)) or revoked
+            if user_id:
+                revoked = bool(next(replies)) or revoked
+        return revoked
+
+    @staticmethod
+    def _read_user_state(replies: Iterator[Any]) -> tuple[bool, int]:
+        """Consume the replies queued by _queue_user_state as (all revoked, version)"""
+        all_revoked, raw_version = next(replies), next(replies)
+        return bool(all_revoked), int(raw_version) if raw_version else 0
+
+    def _read_token_state(self, replies: Iterator[Any], user_id: str | None) -> tuple[bool, int]:
+        """Consume the replies queued by _queue_token_state"""
+        revoked = self._read_token_revocation(replies, user_id)
+        version = 0
+        if user_id:
+            all_revoked, version = self._read_user_state(replies)
+            revoked = revoked or all_revoked
+        return revoked, version
+
+    # Reads through the near cache are split into a local check, the lookups queued for
+    # what it missed and a read of their replies that fills it, so only the round trip
+    # differs between the sync and async storages
+
+    def _near_cache_generation(self) -> int:
+        return self.near_cache.generation if self.near_cache is not None else 0
+
+    def _cached_versions(self, user_ids: list[str]) -> tuple[dict[str, int], list[str]]:
+        """Split users into their cached token versions and the ones to read from Redis"""
+        if self.near_cache is None:
+            return {}, list(user_ids)
+        versions = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self.near_cache.get(user_id)
+            if cached is None:
+                missing.append(user_id)
+            else:
+                versions[user_id] = cached[1]
+        return versions, missing
+
+    def _queue_versions(self, pipe: Any, user_ids: list[str]) -> None:
+        """Queue the lookups for the token versions of users missing from the near cache"""
+        if self.near_cache is None:
+            pipe.mget([self._key("token_version:", user_id) for user_id in user_ids])
+            return
+        # The "all revoked" flag comes along so the near cache holds the user's whole state
+        for user_id in user_ids:
+            self._queue_user_state(pipe, user_id)
+
+    def _read_versions(self, replies: Iterator[Any], user_ids: list[str], generation: int) -> dict[str, int]:
+        """Consume the replies queued by _queue_versions, filling the near cache"""
+        if self.near_cache is None:
+            return {user_id: int(v) if v else 0 for user_id, v in zip(user_ids, next(replies), strict=True)}
+        versions = {}
+        for user_id in user_ids:
+            all_revoked, versions[user_id] = self._read_user_state(replies)
+            self.near_cache.put(user_id, all_revoked, versions[user_id], generation)
+        return versions
+
+    def _cached_user_state(self, user_id: str | None) -> tuple[bool, int] | None:
+        """The user's cached (all revoked, version), if any"""
+        if self.near_cache is None or not user_id:
+            return None
+        return self.near_cache.get(user_id)
+
+    def _queue_token_lookup(self, pipe: Any, token: str, user_id: str | None, cached: tuple[bool, int] | None) -> None:
+        """Queue the lookups resolving a token's state, given its user's cached state"""
+        # Only the user's state is cached, per-token revocations are always read
+        self._queue_token_revocation(pipe, token, user_id)
+        if user_id and cached is None:
+            self._queue_user_state(pipe, user_id)
+
+    def _read_token_lookup(
+        self, replies: Iterator[Any], user_id: str | None, cached: tuple[bool, int] | None, generation: int
+    ) -> tuple[bool, int]:
+        """Consume the replies queued by _queue_token_lookup, filling the near cache"""
+        revoked = self._read_token_revocation(replies, user_id)
+        if cached is not None:
+            return revoked or cached[0], cached[1]
+        if not user_id:
+            return revoked, 0
+        all_revoked, version = self._read_user_state(replies)
+        if self.near_cache is not None:
+            self.near_cache.put(user_id, all_revoked, version, generation)
+        return revoked or all_revoked, version
+
+    def _queue_revocation(self, pipe: Any, token: str, expires_at: float | None) -> None:
+        """Queue storing a token's revocation until it expires and telling other processes"""
+        ttl = self._revocation_ttl(expires_at)
+        if ttl > 0:
+            pipe.set(self._revoked_key(token), "1", ex=ttl)
+        if self.near_cache is not None:
+            # Lets their verified-token caches drop the token right away
+            pipe.publish(self.near_cache.token_channel, token_digest(token).hex())
+
+    def _queue_version_increment(self, pipe: Any, user_id: str) -> None:
+        """Queue bumping a user's token version and telling other processes' near caches"""
+        pipe.incr(self._key("token_version:", user_id))
+        if self.near_cache is not None:
+            pipe.publish(self.near_cache.channel, user_id)
+
+    def _read_version_increment(self, replies: Iterator[Any], user_id: str) -> int:
+        """Consume the replies queued by _queue_version_increment as the new version"""
+        new_version = int(next(replies))
+        if self.near_cache is not None:
+            next(replies)
+            self.near_cache.invalidate(user_id)
+        return new_version
 
-        # Store in revoked tokens set
-        self.redis.set(self._key("revoked:", token), "1", ex=exp)
+    def _csrf_key(self, user_id: str, token_hash: str) -> str:
+        return self._key("csrf:", user_id, ":", token_hash)
 
-        # Add to user's revoked tokens if user_id provided
-        if user_id:
-            self.redis.sadd(self._key("user_revoked:", user_id), token)
+    def _csrf_index_key(self, user_id: str) -> str:
+        # Sorted set of the user's CSRF token hashes, scored by expiry
+        return self._key("csrf_index:", user_id)
 
-    def revoke_all_user_tokens(self, user_id: str) -> None:
-        # Mark all user tokens as revoked by setting a flag
-        self.redis.set(self._key("user_all_revoked:", user_id), "1")
+    def _queue_csrf_store(self, pipe: Any, user_id: str, token_hash: str, expires_at: datetime) -> None:
+        """Queue storing a CSRF token and indexing it by expiry"""
+        expiry_ts = expires_at.timestamp()
+        key = self._csrf_key(user_id, token_hash)
+        index_key = self._csrf_index_key(user_id)
+        pipe.hset(key, mapping={"expires_at": expiry_ts, "used": 0})
+        pipe.zadd(index_key, {token_hash: expiry_ts})
 
-        # Increment token version to invalidate all tokens
-        self.increment_user_token_version(user_id)
+        # Set expiration on Redis keys, the index lives as long as the newest token
+        seconds_until_expiry = int(expiry_ts - time.time())
+        if seconds_until_expiry > 0:
+            pipe.expire(key, seconds_until_expiry)
+            pipe.expire(index_key, seconds_until_expiry)
+
+    @staticmethod
+    def _queue_csrf_expired(pipe: Any, index_keys: list[Any], now: float) -> None:
+        """Queue popping the expired entries of the given CSRF indexes"""
+        for index_key in index_keys:
+            pipe.zrangebyscore(index_key, "-inf", now)
+            pipe.zremrangebyscore(index_key, "-inf", now)
+
+    def _read_csrf_expired(self, replies: Iterator[Any], index_keys: list[Any]) -> list[str]:
+        """Consume the replies queued by _queue_csrf_expired as the token keys to delete"""
+        expired = []
+        for index_key in index_keys:
+            user_id = self._csrf_index_user(index_key)
+            token_hashes, _ = next(replies), next(replies)
+            expired.extend(
+                self._csrf_key(user_id, token_hash.decode() if isinstance(token_hash, bytes) else token_hash)
+                for token_hash in token_hashes
+            )
+        return expired
+
+    def _csrf_index_user(self, index_key: str | bytes) -> str:
+        if isinstance(index_key, bytes):
+            index_key = index_key.decode()
+        return index_key[len(self._csrf_index_key("")) :]
+
+
+# CSRF indexes swept per pipeline by a global cleanup
+CSRF_CLEANUP_BATCH = 500
+
+# Checks, expires and optionally consumes a CSRF token in one round trip.
+# KEYS[1] is the token hash, ARGV is (now, consume)
+CSRF_VERIFY_SCRIPT = """
+local token = redis.call('HMGET', KEYS[1], 'expires_at', 'used')
+if not token[1] then
+    return 0
+end
+if tonumber(token[1]) < tonumber(ARGV[1]) then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+if token[2] == '1' then
+    return 0
+end
+if ARGV[2] == '1' then
+    redis.call('HSET', KEYS[1], 'used', 1)
+end
+return 1
+"""
 
-    def is_token_revoked(self, token: str, user_id: str | None = None) -> bool:
-        # Check if specific token is revoked
-        if self.redis.exists(self._key("revoked:", token)):
-            return True
 
-        # If user_id provided, check if all user tokens are revoked
-        if user_id:
-            if self.redis.exists(self._key("user_all_revoked:", user_id)):
-                return True
+# Redis-based implementation
+class RedisTokenStorage(RedisKeyspace, TokenStorage):
+    def __init__(
+        self,
+        redis_client: Redis,
+        prefix: str = "fastauth:",
+        near_cache: UserStateNearCache | None = None,
+        legacy_revocation_keys: bool = False,
+    ) -> None:
+        self.redis = redis_client
+        self.prefix = prefix
+        self.near_cache = near_cache
+        self.legacy_revocation_keys = legacy_revocation_keys
+        self._verify_csrf = redis_client.register_script(CSRF_VERIFY_SCRIPT)
+        if near_cache is not None:
+            # Let local caches (e.g. the verified-token cache) follow changes made by other processes
+            near_cache.on_remote_invalidation.append(self._notify_invalidation)
+
+    def add_revoked_token(self, token: str, user_id: str | None = None, expires_at: float | None = None) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_revocation(pipe, token, expires_at)
+        pipe.execute()
+        self._notify_invalidation(token_digest(token), user_id)
 
-            # Check if this specific token is in user's revoked set
-            if self.redis.sismember(self._key("user_revoked:", user_id), token):
-                return True
+    def revoke_all_user_tokens(self, user_id: str) -> None:
+        # Flag all user tokens as revoked and bump the token version in one round trip
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self._key("user_all_revoked:", user_id), "1")
+        self._queue_version_increment(pipe, user_id)
+        replies = iter(pipe.execute())
+        next(replies)
+        self._read_version_increment(replies, user_id)
+        self._notify_invalidation(user_id=user_id)
 
-        return False
+    def is_token_revoked(self, token: str, user_id: str | None = None) -> bool:
+        revoked, _ = self.get_token_state(token, user_id)
+        return revoked
 
     def clear_expired_tokens(self, current_time: float) -> None:
         # Redis handles expiration automatically, nothing to do here
         pass
 
+    def migrate_revocation_keys(self, batch_size: int = 500) -> int:
+        """
+        Move revocations stored under full tokens to digest keys, keeping their TTLs.
+
+        Run once after upgrading, while every process still has legacy_revocation_keys
+        enabled. The per-user revoked sets only duplicated the global keys and are dropped.
+        Returns the number of revocations migrated.
+        """
+        migrated = 0
+        prefix_length = len(self._key("revoked:"))
+        batch: list[str] = []
+
+        for key in self.redis.scan_iter(match=self._key("revoked:*"), count=batch_size):
+            suffix = (key.decode() if isinstance(key, bytes) else key)[prefix_length:]
+            if _DIGEST_KEY_RE.fullmatch(suffix):
+                continue
+            batch.append(suffix)
+            if len(batch) >= batch_size:
+                migrated += self._migrate_revocation_batch(batch)
+                batch = []
+        if batch:
+            migrated += self._migrate_revocation_batch(batch)
+
+        for key in self.redis.scan_iter(match=self._key("user_revoked:*"), count=batch_size):
+            self.redis.delete(key)
+
+        return migrated
+
+    def _migrate_revocation_batch(self, tokens: list[str]) -> int:
+        pipe = self.redis.pipeline(transaction=False)
+        for token in tokens:
+            pipe.pttl(self._key("revoked:", token))
+        ttls = pipe.execute()
+
+        migrated = 0
+        pipe = self.redis.pipeline(transaction=False)
+        for token, ttl in zip(tokens, ttls, strict=True):
+            # -2 means the key expired in the meantime, -1 that it never expires
+            if ttl == -2:
+                continue
+            pipe.set(self._revoked_key(token), "1", px=ttl if ttl > 0 else None)
+            pipe.delete(self._key("revoked:", token))
+            migrated += 1
+        pipe.execute()
+        return migrated
+
     def get_user_token_version(self, user_id: str) -> int:
-        version = self.redis.get(self._key("token_version:", user_id))
-        return int(version) if version else 0
+        return self.get_user_token_versions([user_id])[user_id]
+
+    def get_user_token_versions(self, user_ids: list[str]) -> dict[str, int]:
+        versions, missing = self._cached_versions(user_ids)
+        if missing:
+            generation = self._near_cache_generation()
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_versions(pipe, missing)
+            versions.update(self._read_versions(iter(pipe.execute()), missing, generation))
+        return versions
+
+    def get_token_state(self, token: str, user_id: str | None = None) -> tuple[bool, int]:
+        cached = self._cached_user_state(user_id)
+        if cached is not None and cached[0]:
+            return cached
+
+        # Revocation flags and, unless cached, the user's state come back in a single round trip
+        generation = self._near_cache_generation()
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_token_lookup(pipe, token, user_id, cached)
+        return self._read_token_lookup(iter(pipe.execute()), user_id, cached, generation)
+
+    def get_token_states(self, tokens: list[tuple[str, str | None]]) -> list[tuple[bool, int]]:
+        if not tokens:
+            return []
+
+        # Queue every lookup and send them in a single round trip
+        pipe = self.redis.pipeline(transaction=False)
+        for token, user_id in tokens:
+            self._queue_token_state(pipe, token, user_id)
+        replies = iter(pipe.execute())
+
+        return [self._read_token_state(replies, user_id) for _, user_id in tokens]
 
     def increment_user_token_version(self, user_id: str) -> Any:
-        return self.redis.incr(self._key("token_version:", user_id))
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_version_increment(pipe, user_id)
+        new_version = self._read_version_increment(iter(pipe.execute()), user_id)
+        self._notify_invalidation(user_id=user_id)
+        return new_version
 
     def store_csrf_token(self, user_id: str, token_hash: str, expires_at: datetime) -> None:
-        # Convert datetime to timestamp for Redis storage
-        expiry_ts = expires_at.timestamp()
-
-        # Store token with expiration
-        key = self._key("csrf:", user_id, ":", token_hash)
-        self.redis.hset(key, mapping={"expires_at": expiry_ts, "used": 0})
-
-        # Set expiration on Redis key
-        seconds_until_expiry = int(expires_at.timestamp() - time.time())
-        if seconds_until_expiry > 0:
-            self.redis.expire(key, seconds_until_expiry)
-
-    def verify_csrf_token(self, user_id: str, token_hash: str) -> bool:
-        key = self._key("csrf:", user_id, ":", token_hash)
-
-        # Check if token exists
-        if not self.redis.exists(key):
-            return False
-
-        # Get token data
-        token_data = self.redis.hgetall(key)
-        if not token_data:
-            return False
-
-        # Check expiration
-        expires_at = float(token_data.get(b"expires_at", 0))
-        if expires_at < time.time():
-            # Clean up expired token
-            self.redis.delete(key)
-            return False
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_csrf_store(pipe, user_id, token_hash, expires_at)
+        pipe.execute()
 
-        return True
+    def verify_csrf_token(self, user_id: str, token_hash: str, consume: bool = False) -> bool:
+        valid = self._verify_csrf(keys=[self._csrf_key(user_id, token_hash)], args=[time.time(), int(consume)])
+        return bool(valid)
 
     def clear_old_csrf_tokens(self, user_id: str | None = None, max_age_hours: int = 24) -> None:
-        # Redis handles expiration automatically, but we can force cleanup
+        # Expired tokens come out of the per-user expiry indexes, the keyspace is never scanned for them
         if user_id:
-            # Get all CSRF tokens for this user
-            pattern = self._key("csrf:", user_id, ":*")
-            keys = self.redis.keys(pattern)
-
-            # Check each token
-            for key in keys:
-                token_data = self.redis.hgetall(key)
-                if token_data:
-                    expires_at = float(token_data.get(b"expires_at", 0))
-                    if expires_at < time.time():
-                        self.redis.delete(key)
-        else:
-            # This would be expensive, better to rely on Redis expiration
-            pass
+            self._clear_expired_csrf([self._csrf_index_key(user_id)])
+            return
+
+        # Walk the indexes with a cursor, SCAN never blocks the server like KEYS does
+        batch: list[Any] = []
+        for index_key in self.redis.scan_iter(match=self._csrf_index_key("*"), count=CSRF_CLEANUP_BATCH):
+            batch.append(index_key)
+            if len(batch) >= CSRF_CLEANUP_BATCH:
+                self._clear_expired_csrf(batch)
+                batch = []
+        if batch:
+            self._clear_expired_csrf(batch)
+
+    def _clear_expired_csrf(self, index_keys: list[Any]) -> None:
+        """Drop expired tokens from the given indexes, in one round trip plus one delete"""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_csrf_expired(pipe, index_keys, now)
+        expired = self._read_csrf_expired(iter(pipe.execute()), index_keys)
+        if expired:
+            self.redis.delete(*expired)
@@ -0,0 +1,222 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from .cache import TTLCache
+from .storage import InvalidationListener, TokenStorage
+from .utils import token_digest
+
+
+@dataclass(frozen=True)
+class TierPolicy:
+    """How long a method's answers are served from the local tier"""
+
+    # Seconds to keep a positive answer: a revoked token, a non-zero token version
+    ttl: float
+    # Seconds to keep a negative answer, kept short as it hides revocations made elsewhere
+    negative_ttl: float
+
+
+# Methods whose answers may be cached, None disables caching for a method
+DEFAULT_POLICIES: dict[str, TierPolicy | None] = {
+    # Revocations only lift once the token has expired, so positive answers can be kept for long
+    "is_token_revoked": TierPolicy(ttl=60.0, negative_ttl=1.0),
+    "get_user_token_version": TierPolicy(ttl=5.0, negative_ttl=5.0),
+}
+
+_MISSING = object()
+
+
+class TieredTokenStorage(TokenStorage):
+    """
+    Remote storage (usually Redis) fronted by a bounded, process-local cache.
+
+    Revocation and token version reads are answered locally while fresh,
+    according to each method's ``TierPolicy``; misses go to ``remote`` and are
+    remembered. Writes go to ``remote`` and update the local tier in the same
+    call. CSRF tokens and expiry sweeps always go to ``remote``: verification
+    must see every use of a token, so it is never cached.
+
+    Entries are dropped whenever ``remote`` reports an invalidation, which
+    covers changes made by other processes when it has a near cache; anything
+    else made elsewhere is seen once the entry's TTL runs out.
+    """
+
+    def __init__(
+        self,
+        remote: TokenStorage,
+        policies: dict[str, TierPolicy | None] | None = None,
+        max_size: int = 10_000,
+    ) -> None:
+        self.remote = remote
+        self.policies = dict(DEFAULT_POLICIES)
+        for method, policy in (policies or {}).items():
+            if method not in DEFAULT_POLICIES:
+                raise ValueError(f"{method} can't be cached")
+            self.policies[method] = policy
+        self.max_size = max_size
+        self.performs_io = remote.performs_io
+        self.hits = dict.fromkeys(DEFAULT_POLICIES, 0)
+        self.misses = dict.fromkeys(DEFAULT_POLICIES, 0)
+        # Keys are ("revoked", digest, user_id) or ("version", user_id), tagged with the
+        # token digest and/or user id whose invalidation drops them. Each entry's TTL comes from its policy.
+        self._cache = TTLCache(max_size, ttl=0.0)
+        remote.add_invalidation_listener(self._invalidate)
+
+    def add_invalidation_listener(self, listener: InvalidationListener) -> None:
+        # The remote storage performs the writes, so it fires the notifications
+        self.remote.add_invalidation_listener(listener)
+
+    # Local tier
+
+    def _get(self, method: str, key: tuple) -> Any:
+        """Return the cached answer for ``key``, or _MISSING"""
+        if self.policies[method] is None:
+            return _MISSING
+        value = self._cache.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses[method] += 1
+        else:
+            self.hits[method] += 1
+        return value
+
+    def _put(self, method: str, key: tuple, value: Any, generation: int, owners: tuple[str | bytes, ...]) -> None:
+        policy = self.policies[method]
+        if policy is None:
+            return
+        self._cache.set(key, value, policy.ttl if value else policy.negative_ttl, generation, owners)
+
+    def _invalidate(self, digest: bytes | None = None, user_id: str | None = None) -> None:
+        # A token's revocation comes with its user id, only user-wide changes touch the user's entries
+        owner: str | bytes | None = digest if digest is not None else user_id
+        self._cache.invalidate(tags=(owner,) if owner is not None else ())
+
+    def _revoked_key(self, token: str, user_id: str | None) -> tuple:
+        return ("revoked", token_digest(token), user_id or "")
+
+    def _cache_revoked(self, token: str, user_id: str | None, revoked: bool, generation: int) -> None:
+        key = self._revoked_key(token, user_id)
+        self._put("is_token_revoked", key, revoked, generation, (key[1], key[2]))
+
+    def _cache_version(self, user_id: str, version: int, generation: int) -> None:
+        self._put("get_user_token_version", ("version", user_id), version, generation, (user_id,))
+
+    def clear(self) -> None:
+        """Drop every local entry and reset the counters"""
+        self._cache.clear()
+        self.hits = dict.fromkeys(DEFAULT_POLICIES, 0)
+        self.misses = dict.fromkeys(DEFAULT_POLICIES, 0)
+
+    @property
+    def size(self) -> int:
+        """Number of local entries; no __len__, an empty storage must not be falsy"""
+        return len(self._cache)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Return hits, misses and the hit ratio of each cached method"""
+        stats = {}
+        for method in DEFAULT_POLICIES:
+            hits, misses = self.hits[method], self.misses[method]
+            stats[method] = {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses) if hits else 0.0}
+        return stats
+
+    # Revocations and token versions
+
+    def add_revoked_token(self, token: str, user_id: str | None = None, expires_at: float | None = None) -> None:
+        self.remote.add_revoked_token(token, user_id, expires_at)
+        self._cache_revoked(token, user_id, True, self._cache.generation)
+
+    def revoke_all_user_tokens(self, user_id: str) -> None:
+        self.remote.revoke_all_user_tokens(user_id)
+        self._invalidate(user_id=user_id)
+
+    def is_token_revoked(self, token: str, user_id: str | None = None) -> bool:
+        revoked = self._get("is_token_revoked", self._revoked_key(token, user_id))
+        if revoked is _MISSING:
+            generation = self._cache.generation
+            revoked = self.remote.is_token_revoked(token, user_id)
+            self._cache_revoked(token, user_id, revoked, generation)
+        return bool(revoked)
+
+    def clear_expired_tokens(self, current_time: float) -> None:
+        self.remote.clear_expired_tokens(current_time)
+
+    def get_user_token_version(self, user_id: str) -> int:
+        version = self._get("get_user_token_version", ("version", user_id))
+        if version is _MISSING:
+            generation = self._cache.generation
+            version = self.remote.get_user_token_version(user_id)
+            self._cache_version(user_id, version, generation)
+        return int(version)
+
+    def increment_user_token_version(self, user_id: str) -> int:
+        version = self.remote.increment_user_token_version(user_id)
+        self._invalidate(user_id=user_id)
+        self._cache_version(user_id, version, self._cache.generation)
+        return version
+
+    def get_user_token_versions(self, user_ids: list[str]) -> dict[str, int]:
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            version = self._get("get_user_token_version", ("version", user_id))
+            if version is _MISSING:
+                missing.append(user_id)
+            else:
+                result[user_id] = version
+
+        if missing:
+            generation = self._cache.generation
+            for user_id, version in self.remote.get_user_token_versions(missing).items():
+                self._cache_version(user_id, version, generation)
+                result[user_id] = version
+        return result
+
+    def _cached_token_state(self, token: str, user_id: str | None) -> tuple[bool, int] | None:
+        revoked = self._get("is_token_revoked", self._revoked_key(token, user_id))
+        version = self._get("get_user_token_version", ("version", user_id)) if user_id else 0
+        if revoked is _MISSING or version is _MISSING:
+            return None
+        return revoked, version
+
+    def _cache_token_state(self, token: str, user_id: str | None, state: tuple[bool, int], generation: int) -> None:
+        self._cache_revoked(token, user_id, state[0], generation)
+        if user_id:
+            self._cache_version(user_id, state[1], generation)
+
+    def get_token_state(self, token: str, user_id: str | None = None) -> tuple[bool, int]:
+        state = self._cached_token_state(token, user_id)
+        if state is None:
+            # Both halves come back from the remote in one call
+            generation = self._cache.generation
+            state = self.remote.get_token_state(token, user_id)
+            self._cache_token_state(token, user_id, state, generation)
+        return state
+
+    def get_token_states(self, tokens: list[tuple[str, str | None]]) -> list[tuple[bool, int]]:
+        cached = [self._cached_token_state(token, user_id) for token, user_id in tokens]
+        missing = [pair for pair, state in zip(tokens, cached, strict=True) if state is None]
+        if not missing:
+            return cached  # type: ignore[return-value]
+
+        # Every miss goes to the remote in a single batch
+        generation = self._cache.generation
+        fetched = iter(self.remote.get_token_states(missing))
+        states = []
+        for (token, user_id), state in zip(tokens, cached, strict=True):
+            if state is None:
+                state = next(fetched)
+                self._cache_token_state(token, user_id, state, generation)
+            states.append(state)
+        return states
+
+    # CSRF tokens are never cached
+
+    def store_csrf_token(self, user_id: str, token_hash: str, expires_at: datetime) -> None:
+        self.remote.store_csrf_token(user_id, token_hash, expires_at)
+
+    def verify_csrf_token(self, user_id: str, token_hash: str, consume: bool = False) -> bool:
+        return self.remote.verify_csrf_token(user_id, token_hash, consume)
+
+    def clear_old_csrf_tokens(self, user_id: str | None = None, max_age_hours: int = 24) -> None:
+        self.remote.clear_old_csrf_tokens(user_id, max_age_hours)
@@ -1,23 +1,39 @@
 import importlib.util
 import time
+from collections.abc import Iterable
 from datetime import UTC, datetime, timedelta
 from typing import Any, Optional
 
 from fastapi import HTTPException, status
-from jose import JWTError, jwt
+from jose import JWTError
+from jose.exceptions import JWTClaimsError
 from pydantic import ValidationError
 
-from .models import TokenData, TokenResponse, User
+from .async_storage import AsyncRedisTokenStorage, AsyncTokenStorage, SyncTokenStorageAdapter
+from .cache import NegativeTokenCache, VerifiedTokenCache
+from .codec import JWTCodec, default_codec
+from .models import FastTokenData, TokenData, TokenResponse, User
+from .near_cache import UserStateNearCache
 from .storage import MemoryTokenStorage, RedisTokenStorage, TokenStorage
+from .utils import looks_like_jwt
 
 # Module-level variables
 _token_manager: Optional["TokenManager"] = None
 _token_storage: TokenStorage | None = None
+_async_token_storage: AsyncTokenStorage | None = None
 
 # Try to load redis if available
 _redis_available = importlib.util.find_spec("redis") is not None
 
 
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
 class TokenManager:
     def __init__(
         self,
@@ -26,20 +42,41 @@ class TokenManager:
         access_token_expire_minutes: int = 30,
         refresh_token_expire_days: int = 7,
         token_storage: TokenStorage | None = None,
+        verify_cache: VerifiedTokenCache | None = None,
+        codec: JWTCodec | None = None,
+        async_token_storage: AsyncTokenStorage | None = None,
+        fast_token_data: bool = False,
+        negative_cache: NegativeTokenCache | None = None,
     ):
         self.secret_key = secret_key
         self.algorithm = algorithm
+        self.codec = codec or default_codec(secret_key, algorithm)
         self.access_token_expire_minutes = access_token_expire_minutes
         self.refresh_token_expire_days = refresh_token_expire_days
         self.token_storage = token_storage or MemoryTokenStorage()
+        # Used by the a* methods; defaults to running token_storage off the event loop
+        self.async_token_storage = async_token_storage or SyncTokenStorageAdapter(self.token_storage)
+        self.verify_cache = verify_cache
+        # Return slotted FastTokenData instead of validated pydantic models
+        self.fast_token_data = fast_token_data
+        self.negative_cache = negative_cache
+        self.rejected_by_precheck = 0
+        self.rejected_by_cache = 0
+
+        # Drop cached verifications as soon as storage revokes or rotates them
+        if self.verify_cache is not None:
+            self.token_storage.add_invalidation_listener(self.verify_cache.invalidate)
+            if async_token_storage is not None:
+                async_token_storage.add_invalidation_listener(self.verify_cache.invalidate)
 
     def create_token(
         self,
         data: dict[str, Any],
         token_type: str = "access",
         add_timestamp_offset: bool = False,
+        token_version: int | None = None,
     ) -> str:
-        """Create a new token"""
+        """Create a new token, reading the user's token version unless one is given"""
         to_encode = data.copy()
 
         # Add a small random offset to ensure different tokens
@@ -58,12 +95,11 @@ class TokenManager:
 
         # Add token version if user_id is present
         if "sub" in to_encode:
-            user_id = to_encode["sub"]
-            token_version = self.token_storage.get_user_token_version(user_id)
+            if token_version is None:
+                token_version = self.token_storage.get_user_token_version(to_encode["sub"])
             to_encode["ver"] = token_version
 
-        encoded_jwt: str = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
-        return encoded_jwt
+        return self.codec.encode(to_encode)
 
     def create_access_token(self, data: dict[str, Any]) -> str:
         """Create a new access token"""
@@ -77,8 +113,7 @@ class TokenManager:
             token_version = self.token_storage.get_user_token_version(user_id)
             to_encode["ver"] = token_version
 
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
-        return encoded_jwt
+        return self.codec.encode(to_encode)
 
     def create_refresh_token(self, data: dict[str, Any]) -> Any:
         """Create a new refresh token"""
@@ -92,60 +127,163 @@ class TokenManager:
             token_version = self.token_storage.get_user_token_version(user_id)
             to_encode["ver"] = token_version
 
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
-        return encoded_jwt
+        return self.codec.encode(to_encode)
 
     def verify_token(self, token: str) -> TokenData:
         """Verify a token and return the decoded payload"""
-        try:
-            # Decode the token
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            user_id: str = payload.get("sub")
-            roles: list[str] = payload.get("roles", [])
-            token_version: int = payload.get("ver", 0)
-
-            if user_id is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid authentication credentials",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
+        if self.verify_cache is not None:
+            cached = self.verify_cache.get(token)
+            if cached is not None:
+                return cached
 
-            # Check if token is revoked
-            if self.token_storage.is_token_revoked(token, user_id):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token has been revoked",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
+        payload = self._decode_token(token)
+        user_id: str = payload["sub"]
 
-            # Check token version
-            current_version = self.token_storage.get_user_token_version(user_id)
-            if token_version < current_version:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token version is outdated, please login again",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
+        # Revocation and the current version are resolved together, in one round trip where supported
+        generation = self._cache_generation()
+        revoked, current_version = self.token_storage.get_token_state(token, user_id)
+        return self._check_token_state(token, payload, revoked, current_version, generation)
+
+    def verify_tokens_many(self, tokens: Iterable[str]) -> list[TokenData | str]:
+        """
+        Verify many tokens, resolving revocation and version state in one storage call.
 
-            token_data = TokenData(user_id=user_id, roles=roles)
-            return token_data
+        Returns the token data, or the reason it was rejected, for each token in order.
+        """
+        tokens = list(tokens)
+        results: list[TokenData | str] = [""] * len(tokens)
+        pending: list[tuple[int, dict[str, Any]]] = []
+
+        for index, token in enumerate(tokens):
+            cached = self.verify_cache.get(token) if self.verify_cache is not None else None
+            if cached is not None:
+                results[index] = cached
+                continue
+
+            try:
+                pending.append((index, self._decode_token(token)))
+            except HTTPException as e:
+                results[index] = e.detail
+
+        if not pending:
+            return results
+
+        generation = self._cache_generation()
+        states = self.token_storage.get_token_states([(tokens[index], payload["sub"]) for index, payload in pending])
+        for (index, payload), (revoked, current_version) in zip(pending, states, strict=True):
+            try:
+                results[index] = self._check_token_state(tokens[index], payload, revoked, current_version, generation)
+            except HTTPException as e:
+                results[index] = e.detail
+
+        return results
+
+    def _decode_token(self, token: str) -> dict[str, Any]:
+        """Decode a token and check it identifies a user"""
+        # Garbage and recently rejected tokens never reach the codec
+        if not looks_like_jwt(token):
+            self.rejected_by_precheck += 1
+            raise _unauthorized("Invalid authentication credentials")
+
+        if self.negative_cache is not None:
+            detail = self.negative_cache.get(token)
+            if detail is not None:
+                self.rejected_by_cache += 1
+                raise _unauthorized(detail)
 
-        except (JWTError, ValidationError) as e:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            ) from e
+        try:
+            payload = self.codec.decode(token)
+        except JWTClaimsError as e:
+            # Not cached, a token that isn't valid yet (nbf) may become valid
+            raise _unauthorized("Invalid authentication credentials") from e
+        except JWTError as e:
+            raise self._reject(token, "Invalid authentication credentials") from e
+
+        if payload.get("sub") is None:
+            raise self._reject(token, "Invalid authentication credentials")
+        return payload
+
+    def _reject(self, token: str, detail: str) -> HTTPException:
+        """Build the 401 for a token that can never become valid, remembering it"""
+        if self.negative_cache is not None:
+            self.negative_cache.add(token, detail)
+        return _unauthorized(detail)
+
+    def rejection_stats(self) -> dict[str, int]:
+        """Return how many tokens were rejected without being decoded"""
+        return {"rejected_by_precheck": self.rejected_by_precheck, "rejected_by_cache": self.rejected_by_cache}
+
+    def _cache_generation(self) -> int | None:
+        """Verify cache generation, taken before reading a token's storage state"""
+        return self.verify_cache.generation if self.verify_cache is not None else None
+
+    def _check_token_state(
+        self,
+        token: str,
+        payload: dict[str, Any],
+        revoked: bool,
+        current_version: int,
+        generation: int | None = None,
+    ) -> TokenData:
+        """Build token data for a decoded token once its storage state is known"""
+        if revoked:
+            raise self._reject(token, "Token has been revoked")
+
+        # Check token version
+        if payload.get("ver", 0) < current_version:
+            raise self._reject(token, "Token version is outdated, please login again")
+
+        if self.fast_token_data:
+            token_data = self._fast_token_data(payload)
+        else:
+            try:
+                token_data = TokenData(
+                    user_id=payload["sub"], roles=payload.get("roles", []), scopes=payload.get("scopes", [])
+                )
+            except ValidationError as e:
+                raise _unauthorized("Invalid authentication credentials") from e
+
+        if self.verify_cache is not None:
+            # A revocation landing while the state was read must not be undone by caching
+            self.verify_cache.set(token, token_data, payload.get("exp"), generation)
+        return token_data
+
+    @staticmethod
+    def _fast_token_data(payload: dict[str, Any]) -> FastTokenData:
+        # The signature is verified, so only check the shapes TokenData would have enforced
+        user_id = payload["sub"]
+        roles = payload.get("roles", ())
+        scopes = payload.get("scopes", ())
+        if not (isinstance(user_id, str) and isinstance(roles, list | tuple) and isinstance(scopes, list | tuple)):
+            raise _unauthorized("Invalid authentication credentials")
+        return FastTokenData(user_id, tuple(roles), tuple(scopes))
 
     def generate_tokens(self, user: User) -> TokenResponse:
         """Generate both access and refresh tokens for a user"""
-        access_token_data = {"sub": str(user.id), "roles": user.roles, "type": "access"}
+        token_version = self.token_storage.get_user_token_version(str(user.id))
+        return self._build_tokens(user, token_version)
+
+    def generate_tokens_many(self, users: Iterable[User]) -> list[TokenResponse]:
+        """Generate tokens for many users, reading all token versions in one storage call"""
+        users = list(users)
+        versions = self.token_storage.get_user_token_versions([str(user.id) for user in users])
+        return [self._build_tokens(user, versions.get(str(user.id), 0)) for user in users]
+
+    @staticmethod
+    def _access_claims(user: User, user_id: str) -> dict[str, Any]:
+        claims = {"sub": user_id, "roles": user.roles, "type": "access"}
+        # Only tokens that carry scopes pay for the claim
+        if user.scopes:
+            claims["scopes"] = user.scopes
+        return claims
+
+    def _build_tokens(self, user: User, token_version: int) -> TokenResponse:
+        access_token_data = self._access_claims(user, str(user.id))
 
         refresh_token_data = {"sub": str(user.id), "type": "refresh"}
 
-        access_token = self.create_token(access_token_data)
-        refresh_token = self.create_token(refresh_token_data)
+        access_token = self.create_token(access_token_data, token_version=token_version)
+        refresh_token = self.create_token(refresh_token_data, token_version=token_version)
 
         return TokenResponse(access_token=access_token, refresh_token=refresh_token, token_type="bearer")
 
@@ -159,6 +297,110 @@ class TokenManager:
         # Generate new tokens with the updated version
         return self.generate_tokens(user)
 
+    def refresh_token(self, refresh_token_str: str, user: User) -> TokenResponse:
+        """Refresh access token using a refresh token"""
+        payload = self._decode_refresh_token(refresh_token_str, user)
+        current_version = self.token_storage.get_user_token_version(str(user.id))
+        return self._issue_refreshed_tokens(payload, user, current_version)
+
+    def _decode_refresh_token(self, refresh_token_str: str, user: User) -> dict[str, Any]:
+        """Decode a refresh token and check it belongs to the user"""
+        try:
+            payload = self.codec.decode(refresh_token_str)
+        except JWTError as e:
+            raise _unauthorized("Invalid refresh token") from e
+
+        if payload.get("type") != "refresh":
+            raise _unauthorized("Invalid token type")
+
+        if str(payload.get("sub")) != str(user.id):
+            raise _unauthorized("Token belongs to another user")
+        return payload
+
+    def _issue_refreshed_tokens(self, payload: dict[str, Any], user: User, current_version: int) -> TokenResponse:
+        # Verify token version if present
+        if "ver" in payload and payload.get("ver") != current_version:
+            raise _unauthorized("Token version is outdated")
+
+        # Generate fresh tokens - make sure they're actually new tokens
+        # by adding a small timestamp offset to ensure different expiration times
+        access_token = self.create_token(
+            self._access_claims(user, user.id),
+            add_timestamp_offset=True,
+            token_version=current_version,
+        )
+
+        refresh_token = self.create_token(
+            {"sub": user.id, "type": "refresh"},
+            token_type="refresh",
+            add_timestamp_offset=True,
+            token_version=current_version,
+        )
+
+        return TokenResponse(
+            access_token=access_token,
+            refresh_token=refresh_token,
+            token_type="bearer",
+        )
+
+    def revoke_token(self, token: str) -> None:
+        """Revoke a specific token"""
+        user_id, expires_at = self._revocation_target(token)
+        self.token_storage.add_revoked_token(token, user_id, expires_at)
+
+    def _revocation_target(self, token: str) -> tuple[str | None, float | None]:
+        """
+        Extract the user a token belongs to and when it expires, so the revocation
+        can be dropped together with the token. Tokens that can't be decoded are still revoked.
+        """
+        try:
+            payload = self.codec.decode(token)
+        except JWTError:
+            return None, None
+
+        exp = payload.get("exp")
+        return payload.get("sub"), float(exp) if isinstance(exp, int | float) else None
+
+    def is_token_revoked(self, token: str) -> bool:
+        """Check if a token has been revoked"""
+        try:
+            payload = self.codec.decode(token)
+            user_id = payload.get("sub")
+            return self.token_storage.is_token_revoked(token, user_id)
+        except (JWTError, ValidationError):
+            # If token can't be decoded, consider it invalid but not necessarily revoked
+            return False
+
+    async def averify_token(self, token: str) -> TokenData:
+        """Verify a token without blocking the event loop on storage I/O"""
+        if self.verify_cache is not None:
+            cached = self.verify_cache.get(token)
+            if cached is not None:
+                return cached
+
+        payload = self._decode_token(token)
+        user_id: str = payload["sub"]
+
+        generation = self._cache_generation()
+        revoked, current_version = await self.async_token_storage.get_token_state(token, user_id)
+        return self._check_token_state(token, payload, revoked, current_version, generation)
+
+    async def agenerate_tokens(self, user: User) -> TokenResponse:
+        """Generate both access and refresh tokens for a user without blocking the event loop"""
+        token_version = await self.async_token_storage.get_user_token_version(str(user.id))
+        return self._build_tokens(user, token_version)
+
+    async def arefresh_token(self, refresh_token_str: str, user: User) -> TokenResponse:
+        """Refresh access token using a refresh token without blocking the event loop"""
+        payload = self._decode_refresh_token(refresh_token_str, user)
+        current_version = await self.async_token_storage.get_user_token_version(str(user.id))
+        return self._issue_refreshed_tokens(payload, user, current_version)
+
+    async def arevoke_token(self, token: str) -> None:
+        """Revoke a specific token without blocking the event loop"""
+        user_id, expires_at = self._revocation_target(token)
+        await self.async_token_storage.add_revoked_token(token, user_id, expires_at)
+
 
 # Updated setup function to support Redis
 def setup_token_manager(
@@ -167,18 +409,54 @@ def setup_token_manager(
     access_token_expire_minutes: int = 30,
     refresh_token_expire_days: int = 7,
     redis_url: str | None = None,
+    verify_cache_size: int = 0,
+    verify_cache_ttl: float = 60.0,
+    codec: JWTCodec | None = None,
+    redis_near_cache: bool = False,
+    redis_legacy_revocation_keys: bool = False,
+    fast_token_data: bool = False,
+    negative_cache_size: int = 0,
+    negative_cache_ttl: float = 60.0,
+    csrf_tokens_per_user: int = 16,
 ) -> None:
     """Setup the token manager with configuration"""
-    global _token_manager, _token_storage
+    global _token_manager, _token_storage, _async_token_storage
 
     # Configure storage
     if redis_url and _redis_available:
         import redis
+        import redis.asyncio
 
         redis_client = redis.from_url(redis_url)
-        _token_storage = RedisTokenStorage(redis_client)
+
+        # Optionally cache user token versions locally, kept coherent through Redis pub/sub
+        near_cache = None
+        if redis_near_cache:
+            near_cache = UserStateNearCache(redis_client)
+            near_cache.start()
+
+        _token_storage = RedisTokenStorage(
+            redis_client, near_cache=near_cache, legacy_revocation_keys=redis_legacy_revocation_keys
+        )
+        # The middleware and dependencies talk to Redis through the asyncio client
+        _async_token_storage = AsyncRedisTokenStorage(
+            redis.asyncio.from_url(redis_url),
+            near_cache=near_cache,
+            legacy_revocation_keys=redis_legacy_revocation_keys,
+        )
     else:
-        _token_storage = MemoryTokenStorage()
+        _token_storage = MemoryTokenStorage(csrf_tokens_per_user=csrf_tokens_per_user)
+        _async_token_storage = None
+
+    # Configure the verified-token cache (disabled by default)
+    verify_cache = None
+    if verify_cache_size > 0:
+        verify_cache = VerifiedTokenCache(max_size=verify_cache_size, ttl=verify_cache_ttl)
+
+    # Configure the rejected-token cache (disabled by default)
+    negative_cache = None
+    if negative_cache_size > 0:
+        negative_cache = NegativeTokenCache(max_size=negative_cache_size, ttl=negative_cache_ttl)
 
     # Create token manager
     _token_manager = TokenManager(
@@ -187,6 +465,11 @@ def setup_token_manager(
         access_token_expire_minutes=access_token_expire_minutes,
         refresh_token_expire_days=refresh_token_expire_days,
         token_storage=_token_storage,
+        verify_cache=verify_cache,
+        codec=codec,
+        async_token_storage=_async_token_storage,
+        fast_token_data=fast_token_data,
+        negative_cache=negative_cache,
     )
 
 
@@ -203,82 +486,58 @@ def generate_token(user: User) -> TokenResponse:
     return manager.generate_tokens(user)
 
 
+def generate_tokens_many(users: Iterable[User]) -> list[TokenResponse]:
+    """Generate access and refresh tokens for many users, in order"""
+    manager = _ensure_token_manager()
+    return manager.generate_tokens_many(users)
+
+
 def verify_token(token: str) -> TokenData:
     """Verify a token and return token data"""
     manager = _ensure_token_manager()
     return manager.verify_token(token)
 
 
-def refresh_token(refresh_token_str: str, user: User) -> TokenResponse:
-    """Refresh access token using a refresh token"""
+async def agenerate_token(user: User) -> TokenResponse:
+    """Generate access and refresh tokens for a user without blocking the event loop"""
     manager = _ensure_token_manager()
+    return await manager.agenerate_tokens(user)
 
-    try:
-        payload = jwt.decode(refresh_token_str, manager.secret_key, algorithms=[manager.algorithm])
-        if payload.get("type") != "refresh":
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token type",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        user_id = payload.get("sub")
-        if str(user_id) != str(user.id):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token belongs to another user",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
 
-        # Verify token version if present
-        if "ver" in payload:
-            current_version = manager.token_storage.get_user_token_version(user_id)
-            if payload.get("ver") != current_version:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token version is outdated",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
+async def averify_token(token: str) -> TokenData:
+    """Verify a token without blocking the event loop"""
+    manager = _ensure_token_manager()
+    return await manager.averify_token(token)
 
-        # Generate fresh tokens - make sure they're actually new tokens
-        # by adding a small timestamp offset to ensure different expiration times
-        access_token = manager.create_token(
-            {"sub": user.id, "roles": user.roles, "type": "access"}, add_timestamp_offset=True
-        )
 
-        refresh_token = manager.create_token(
-            {"sub": user.id, "type": "refresh"}, token_type="refresh", add_timestamp_offset=True
-        )
+async def arefresh_token(refresh_token_str: str, user: User) -> TokenResponse:
+    """Refresh access token using a refresh token without blocking the event loop"""
+    manager = _ensure_token_manager()
+    return await manager.arefresh_token(refresh_token_str, user)
 
-        return TokenResponse(
-            access_token=access_token,
-            refresh_token=refresh_token,
-            token_type="bearer",
-        )
 
-    except (JWTError, ValidationError) as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid refresh token",
-            headers={"WWW-Authenticate": "Bearer"},
-        ) from e
+async def arevoke_token(token: str) -> None:
+    """Revoke a specific token without blocking the event loop"""
+    manager = _ensure_token_manager()
+    await manager.arevoke_token(token)
 
 
-def revoke_token(token: str, revoke_refresh: bool = False) -> None:
-    """Revoke a specific token"""
+def verify_tokens_many(tokens: Iterable[str]) -> list[TokenData | str]:
+    """Verify many tokens, returning token data or a rejection reason for each"""
     manager = _ensure_token_manager()
+    return manager.verify_tokens_many(tokens)
 
-    try:
-        # Extract user_id from token
-        payload = jwt.decode(token, manager.secret_key, algorithms=[manager.algorithm])
-        user_id = payload.get("sub")
 
-        # Add to revoked tokens
-        manager.token_storage.add_revoked_token(token, user_id)
+def refresh_token(refresh_token_str: str, user: User) -> TokenResponse:
+    """Refresh access token using a refresh token"""
+    manager = _ensure_token_manager()
+    return manager.refresh_token(refresh_token_str, user)
 
-    except (JWTError, ValidationError):
-        # If token can't be decoded, still revoke it
-        manager.token_storage.add_revoked_token(token)
+
+def revoke_token(token: str, revoke_refresh: bool = False) -> None:
+    """Revoke a specific token"""
+    manager = _ensure_token_manager()
+    manager.revoke_token(token)
 
 
 def revoke_all_user_tokens(user_id: str) -> None:
@@ -300,13 +559,7 @@ def is_token_revoked(token: str) -> bool:
     if _token_manager is None:
         raise RuntimeError("Token manager not initialized. Call setup_token_manager first.")
 
-    try:
-        payload = jwt.decode(token, _token_manager.secret_key, algorithms=[_token_manager.algorithm])
-        user_id = payload.get("sub")
-        return _token_manager.token_storage.is_token_revoked(token, user_id)
-    except (JWTError, ValidationError):
-        # If token can't be decoded, consider it invalid but not necessarily revoked
-        return False
+    return _token_manager.is_token_revoked(token)
 
 
 def clear_expired_revocations() -> None:
@@ -0,0 +1,22 @@
+import hashlib
+import re
+
+# 16 bytes is plenty to key a token without collisions and keeps keys small
+TOKEN_DIGEST_SIZE = 16
+
+
+def token_digest(token: str) -> bytes:
+    """Return a fixed-size digest of an encoded token"""
+    return hashlib.blake2b(token.encode(), digest_size=TOKEN_DIGEST_SIZE).digest()
+
+
+# Longer than any token we issue, with room for large role and scope claims
+MAX_TOKEN_LENGTH = 8192
+
+# Three non-empty base64url segments; padding is tolerated
+_TOKEN_SHAPE = re.compile(r"[A-Za-z0-9_\-=]+\.[A-Za-z0-9_\-=]+\.[A-Za-z0-9_\-=]+")
+
+
+def looks_like_jwt(token: str) -> bool:
+    """Cheap structural check that rules out garbage before any decoding or crypto"""
+    return len(token) <= MAX_TOKEN_LENGTH and _TOKEN_SHAPE.fullmatch(token) is not None
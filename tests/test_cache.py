@@ -0,0 +1,202 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from fastauth.cache import NegativeTokenCache, TTLCache, VerifiedTokenCache
+from fastauth.models import TokenData, User
+from fastauth.storage import MemoryTokenStorage
+from fastauth.token import TokenManager
+
+
+@pytest.fixture
+def test_user():
+    return User(id="user123", username="testuser", roles=["user"])
+
+
+@pytest.fixture
+def manager():
+    return TokenManager(
+        secret_key="test_secret_key",
+        token_storage=MemoryTokenStorage(),
+        verify_cache=VerifiedTokenCache(max_size=2, ttl=60),
+    )
+
+
+def test_cache_hits_and_misses(manager, test_user):
+    tokens = manager.generate_tokens(test_user)
+
+    first = manager.verify_token(tokens.access_token)
+    second = manager.verify_token(tokens.access_token)
+
+    assert first.user_id == second.user_id == test_user.id
+    assert manager.verify_cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_cache_is_bounded():
+    cache = VerifiedTokenCache(max_size=2)
+    for i in range(3):
+        cache.set(f"token{i}", TokenData(user_id=f"user{i}"))
+
+    # The least recently used entry was evicted
+    assert len(cache) == 2
+    assert cache.get("token0") is None
+    assert cache.get("token2") is not None
+
+
+def test_cache_entry_never_outlives_exp():
+    cache = VerifiedTokenCache(ttl=60)
+    cache.set("token", TokenData(user_id="user1"), exp=time.time() - 1)
+
+    assert cache.get("token") is None
+
+
+def test_cache_dropped_on_revocation(manager, test_user):
+    tokens = manager.generate_tokens(test_user)
+    manager.verify_token(tokens.access_token)
+
+    manager.token_storage.add_revoked_token(tokens.access_token, test_user.id)
+
+    with pytest.raises(HTTPException) as exc_info:
+        manager.verify_token(tokens.access_token)
+    assert exc_info.value.status_code == 401
+
+
+def test_cache_dropped_on_version_increment(manager, test_user):
+    tokens = manager.generate_tokens(test_user)
+    manager.verify_token(tokens.access_token)
+
+    manager.token_storage.increment_user_token_version(test_user.id)
+
+    with pytest.raises(HTTPException) as exc_info:
+        manager.verify_token(tokens.access_token)
+    assert "Token version is outdated" in exc_info.value.detail
+
+
+def test_cache_dropped_on_revoke_all(manager, test_user):
+    tokens = manager.generate_tokens(test_user)
+    manager.verify_token(tokens.access_token)
+
+    manager.token_storage.revoke_all_user_tokens(test_user.id)
+
+    assert len(manager.verify_cache) == 0
+    with pytest.raises(HTTPException):
+        manager.verify_token(tokens.access_token)
+
+
+def test_ttl_cache_drops_tagged_entries_and_stale_writes():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1, tags=("user1",))
+    cache.set("b", 2, tags=("user1", "token"))
+    cache.set("c", 3, ttl=0)
+
+    assert len(cache) == 2
+    assert cache.get("a") is None
+    assert cache.get("c", "missing") == "missing"
+
+    generation = cache.generation
+    cache.set("d", 4, tags=("user2",))
+    cache.invalidate(tags=("user1",))
+    assert cache.get("b") is None
+    assert cache.get("d") == 4
+
+    # Read before the invalidation, so possibly stale
+    cache.set("e", 5, generation=generation)
+    assert cache.get("e") is None
+    cache.set("e", 5, generation=cache.generation)
+    assert cache.get("e") == 5
+
+
+def test_negative_cache_is_bounded_and_expires():
+    cache = NegativeTokenCache(max_size=2, ttl=60)
+    cache.add("a.b.c", "Invalid authentication credentials")
+    cache.add("d.e.f", "Token has been revoked")
+    cache.add("g.h.i", "Invalid authentication credentials")
+
+    assert len(cache) == 2
+    assert cache.get("a.b.c") is None
+    assert cache.get("d.e.f") == "Token has been revoked"
+
+    cache.ttl = 0
+    cache.add("j.k.l", "Invalid authentication credentials")
+    assert cache.get("j.k.l") is None
+
+
+@pytest.mark.parametrize(
+    "token",
+    ["", "garbage", "only.two", "a.b.c.d", "a..c", "a.b.c d", "a.b.c\n", "a.b.c!", "a." * 5000 + "b.c"],
+)
+def test_precheck_rejects_malformed_tokens(token):
+    manager = TokenManager(secret_key="test_secret_key", negative_cache=NegativeTokenCache())
+
+    with pytest.raises(HTTPException) as exc_info:
+        manager.verify_token(token)
+
+    assert exc_info.value.status_code == 401
+    assert manager.rejection_stats() == {"rejected_by_precheck": 1, "rejected_by_cache": 0}
+
+
+def test_repeated_bad_tokens_are_answered_from_cache(test_user):
+    manager = TokenManager(secret_key="test_secret_key", negative_cache=NegativeTokenCache())
+    forged = manager.generate_tokens(test_user).access_token[:-2] + "xx"
+
+    for _ in range(3):
+        with pytest.raises(HTTPException):
+            manager.verify_token(forged)
+    assert manager.rejection_stats() == {"rejected_by_precheck": 0, "rejected_by_cache": 2}
+
+    # Revocations are remembered with their reason
+    token = manager.generate_tokens(test_user).access_token
+    manager.revoke_token(token)
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            manager.verify_token(token)
+        assert exc_info.value.detail == "Token has been revoked"
+    assert manager.rejected_by_cache == 3
+
+
+def test_not_yet_valid_tokens_are_not_cached(test_user):
+    manager = TokenManager(secret_key="test_secret_key", negative_cache=NegativeTokenCache())
+    token = manager.create_token({"sub": "user123", "type": "access", "nbf": int(time.time()) + 3600})
+
+    with pytest.raises(HTTPException):
+        manager.verify_token(token)
+    assert len(manager.negative_cache) == 0
+
+
+class RacingStorage(MemoryTokenStorage):
+    """Reads a token's state, then sees it revoked before the verification finishes"""
+
+    performs_io = True
+
+    def get_token_state(self, token, user_id=None):
+        state = super().get_token_state(token, user_id)
+        if not getattr(self, "raced", False):
+            self.raced = True
+            self.add_revoked_token(token, user_id)
+        return state
+
+
+def test_revocation_during_verification_is_not_cached(test_user):
+    manager = TokenManager(
+        secret_key="test_secret_key", token_storage=RacingStorage(), verify_cache=VerifiedTokenCache(ttl=60)
+    )
+    token = manager.generate_tokens(test_user).access_token
+
+    # The racing verification still returns the state it read, but must not cache it
+    manager.verify_token(token)
+    assert len(manager.verify_cache) == 0
+    with pytest.raises(HTTPException):
+        manager.verify_token(token)
+
+
+def test_async_revocation_during_verification_is_not_cached(test_user):
+    manager = TokenManager(
+        secret_key="test_secret_key", token_storage=RacingStorage(), verify_cache=VerifiedTokenCache(ttl=60)
+    )
+    token = manager.generate_tokens(test_user).access_token
+
+    asyncio.run(manager.averify_token(token))
+    with pytest.raises(HTTPException):
+        asyncio.run(manager.averify_token(token))
@@ -0,0 +1,63 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from jose import JWTError, jwt
+
+from fastauth.codec import HMACJWTCodec, JoseJWTCodec, default_codec
+
+SECRET = "test_secret_key"
+
+
+@pytest.fixture
+def claims():
+    return {"sub": "user123", "roles": ["user"], "exp": datetime.now(UTC) + timedelta(minutes=5)}
+
+
+@pytest.mark.parametrize("algorithm", ["HS256", "HS384", "HS512"])
+def test_hmac_codec_matches_jose(claims, algorithm):
+    codec = HMACJWTCodec(SECRET, algorithm)
+
+    # Tokens are byte-for-byte identical to python-jose's
+    assert codec.encode(claims) == jwt.encode(claims, SECRET, algorithm=algorithm)
+
+    # And each backend accepts the other's tokens
+    assert jwt.decode(codec.encode(claims), SECRET, algorithms=[algorithm])["sub"] == "user123"
+    assert codec.decode(jwt.encode(claims, SECRET, algorithm=algorithm))["sub"] == "user123"
+
+
+def test_hmac_codec_rejects_tampered_signature(claims):
+    codec = HMACJWTCodec(SECRET)
+    token = codec.encode(claims)
+    tampered = token[:-4] + ("AAAA" if not token.endswith("AAAA") else "BBBB")
+
+    with pytest.raises(JWTError):
+        codec.decode(tampered)
+
+    with pytest.raises(JWTError):
+        HMACJWTCodec("another_secret").decode(token)
+
+
+def test_hmac_codec_rejects_expired_token(claims):
+    codec = HMACJWTCodec(SECRET)
+    claims["exp"] = datetime.now(UTC) - timedelta(minutes=5)
+
+    with pytest.raises(JWTError):
+        codec.decode(codec.encode(claims))
+
+
+def test_hmac_codec_rejects_other_algorithm(claims):
+    token = jwt.encode(claims, SECRET, algorithm="HS512")
+
+    with pytest.raises(JWTError):
+        HMACJWTCodec(SECRET, "HS256").decode(token)
+
+
+@pytest.mark.parametrize("token", ["", "invalid.token.string", "a.b", "a.b.c.d", "é.é.é"])
+def test_hmac_codec_rejects_malformed_token(token):
+    with pytest.raises(JWTError):
+        HMACJWTCodec(SECRET).decode(token)
+
+
+def test_default_codec():
+    assert isinstance(default_codec(SECRET, "HS256"), HMACJWTCodec)
+    assert isinstance(default_codec(SECRET, "RS256"), JoseJWTCodec)
@@ -4,7 +4,7 @@ from fastapi.testclient import TestClient
 
 from fastauth.csrf import clear_old_tokens, csrf_protection, generate_csrf_token, verify_csrf_token
 from fastauth.models import User
-from fastauth.token import setup_token_manager
+from fastauth.token import _ensure_token_manager, setup_token_manager
 
 
 @pytest.fixture(autouse=True)
@@ -114,3 +114,93 @@ def test_csrf_middleware_authenticated_invalid_token(client):
 
     # Test will pass since we can't properly set request.state.user in a test client
     assert response.status_code == 200
+
+
+def test_stateless_csrf_token_round_trip(test_user):
+    token = generate_csrf_token(test_user.id, stateless=True, nonce="session-1")
+
+    assert verify_csrf_token(test_user.id, token, stateless=True, nonce="session-1") is True
+    assert verify_csrf_token("wrong_user", token, stateless=True, nonce="session-1") is False
+    assert verify_csrf_token(test_user.id, token, stateless=True, nonce="session-2") is False
+    assert verify_csrf_token(test_user.id, token, stateless=True) is False
+    # Stateless tokens are unknown to the storage-backed mode
+    assert verify_csrf_token(test_user.id, token) is False
+
+
+def test_stateless_csrf_token_is_not_stored(test_user):
+    storage = _ensure_token_manager().token_storage
+    generate_csrf_token(test_user.id, stateless=True)
+    assert storage._csrf_tokens == {}
+
+
+def test_stateless_csrf_token_rejects_tampering_and_expiry(test_user):
+    token = generate_csrf_token(test_user.id, stateless=True)
+    expires_at, salt, signature = token.split(".")
+
+    assert verify_csrf_token(test_user.id, f"{int(expires_at) + 3600}.{salt}.{signature}", stateless=True) is False
+    for malformed in ("not-a-token", "\xb2.a.b", "١٢٣.a.b", ".a.b", "1.a.b.c", "-1.a.b", "9999999999.ab.\xe9"):
+        assert verify_csrf_token(test_user.id, malformed, stateless=True) is False
+
+    expired = generate_csrf_token(test_user.id, max_age_hours=-1, stateless=True)
+    assert verify_csrf_token(test_user.id, expired, stateless=True) is False
+
+    with pytest.raises(ValueError):
+        verify_csrf_token(test_user.id, token, consume=True, stateless=True)
+
+
+def test_stateless_csrf_protection(test_user):
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def fake_auth(request: Request, call_next):
+        request.state.user = MockUser(test_user.id)
+        return await call_next(request)
+
+    @app.post("/submit")
+    async def submit(
+        csrf_check=Depends(csrf_protection(stateless=True, nonce_getter=lambda r: r.headers.get("X-Session")))
+    ):
+        return {"status": "success"}
+
+    client = TestClient(app)
+    token = generate_csrf_token(test_user.id, stateless=True, nonce="abc")
+
+    assert client.post("/submit", headers={"X-CSRF-Token": token, "X-Session": "abc"}).status_code == 200
+    assert client.post("/submit", headers={"X-CSRF-Token": token, "X-Session": "xyz"}).status_code == 403
+    # Non-ASCII digits in the expiry are rejected, not a server error
+    malformed = [(b"x-csrf-token", b"\xb2.a.b"), (b"x-session", b"abc")]
+    assert client.post("/submit", headers=malformed).status_code == 403
+    malformed = [(b"x-csrf-token", b"9999999999.ab.\xe9"), (b"x-session", b"abc")]
+    assert client.post("/submit", headers=malformed).status_code == 403
+    assert client.post("/submit").status_code == 403
+
+
+def test_csrf_protection_awaits_async_storage(test_user, monkeypatch):
+    manager = _ensure_token_manager()
+    token = generate_csrf_token(test_user.id)
+    calls = []
+
+    async def verify_csrf_token(user_id, token_hash, consume=False):
+        calls.append((user_id, consume))
+        return True
+
+    def blocking_verify(*args):
+        raise AssertionError("csrf_protection must not call the sync storage")
+
+    monkeypatch.setattr(manager.async_token_storage, "verify_csrf_token", verify_csrf_token)
+    monkeypatch.setattr(manager.token_storage, "verify_csrf_token", blocking_verify)
+
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def fake_auth(request: Request, call_next):
+        request.state.user = MockUser(test_user.id)
+        return await call_next(request)
+
+    @app.post("/submit")
+    async def submit(csrf_check=Depends(csrf_protection(single_use=True))):
+        return {"status": "success"}
+
+    response = TestClient(app).post("/submit", headers={"X-CSRF-Token": token})
+    assert response.status_code == 200
+    assert calls == [(test_user.id, True)]
@@ -0,0 +1,49 @@
+import pytest
+
+from fastauth.paths import PathMatcher
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("/docs", True),
+        ("/docs/oauth2-redirect", True),
+        ("/static/css/site.css", True),
+        ("/health", True),
+        ("/health/deep", False),
+        ("/webhooks/github/events", True),
+        ("/webhooks/github/events/1", False),
+        ("/webhooks/github", False),
+        ("/api/users", False),
+        ("/", False),
+    ],
+)
+def test_prefix_exact_and_glob_patterns(path, expected):
+    matcher = PathMatcher(["/docs", "/static/", "=/health", "/webhooks/*/events"])
+    assert matcher.matches(path) is expected
+
+
+def test_nested_prefixes_match_the_shortest():
+    matcher = PathMatcher(["/api/public", "/api/public/v2"])
+
+    assert matcher.matches("/api/public")
+    assert matcher.matches("/api/publicity")
+    assert not matcher.matches("/api/pub")
+
+
+def test_empty_matcher_matches_nothing():
+    matcher = PathMatcher([])
+
+    assert not matcher
+    assert not matcher.matches("/anything")
+
+
+def test_empty_prefix_matches_everything():
+    assert PathMatcher([""]).matches("/anything")
+
+
+def test_many_patterns_are_matched_exactly():
+    matcher = PathMatcher([f"/excluded/{i}/" for i in range(500)])
+
+    assert matcher.matches("/excluded/499/item")
+    assert not matcher.matches("/excluded/500/item")
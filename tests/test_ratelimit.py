@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from fastauth import ratelimit
+from fastauth.middleware import AuthMiddleware, register_auth_middleware
+from fastauth.models import User
+from fastauth.ratelimit import MemoryRateLimiter, RedisRateLimiter, take_token
+from fastauth.token import generate_token, setup_token_manager
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    monkeypatch.setattr(ratelimit.time, "time", clock)
+    return clock
+
+
+def test_take_token_refills_over_time():
+    state, retry_after = take_token(None, 0.0, rate=1.0, burst=2)
+    assert retry_after == 0.0
+    state, retry_after = take_token(state, 0.0, rate=1.0, burst=2)
+    assert retry_after == 0.0
+    state, retry_after = take_token(state, 0.0, rate=1.0, burst=2)
+    assert retry_after == pytest.approx(1.0)
+
+    state, retry_after = take_token(state, 0.5, rate=1.0, burst=2)
+    assert retry_after == pytest.approx(0.5)
+    _, retry_after = take_token(state, 1.0, rate=1.0, burst=2)
+    assert retry_after == 0.0
+
+
+def test_memory_limiter_keys_are_independent(clock):
+    limiter = MemoryRateLimiter(rate=1.0, burst=2)
+
+    assert limiter.hit_sync("user1") == 0.0
+    assert limiter.hit_sync("user1") == 0.0
+    assert limiter.hit_sync("user1") > 0
+    assert limiter.hit_sync("user2") == 0.0
+
+    clock.now += 1
+    assert limiter.hit_sync("user1") == 0.0
+
+
+def test_memory_limiter_prunes_refilled_buckets(clock):
+    limiter = MemoryRateLimiter(rate=1.0, burst=1, shards=1, max_keys=10)
+    for i in range(10):
+        limiter.hit_sync(f"user{i}")
+
+    clock.now += 5
+    limiter.hit_sync("fresh")
+
+    buckets, _ = limiter._shards[0]
+    assert list(buckets) == ["fresh"]
+
+
+def test_memory_limiter_prunes_below_the_cap(clock):
+    limiter = MemoryRateLimiter(rate=0.001, burst=5, shards=1, max_keys=10)
+    buckets, _ = limiter._shards[0]
+    for i in range(10):
+        limiter.hit_sync(f"user{i}")
+    # Recently used buckets are kept over older ones
+    limiter.hit_sync("user0")
+    assert len(buckets) == 10
+
+    # Going over the cap prunes to 90% of it, so the next new key doesn't prune again
+    limiter.hit_sync("user10")
+    assert len(buckets) == 9
+    assert "user0" in buckets and "user1" not in buckets
+    limiter.hit_sync("user11")
+    assert len(buckets) == 10
+
+
+class ScriptRedis:
+    """Runs the limiter script's token bucket in Python, over a dict of hashes"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.expiry = {}
+        self.calls = 0
+
+    def register_script(self, script):
+        assert "HMGET" in script
+
+        async def run(keys, args):
+            self.calls += 1
+            rate, burst, now, expire_ms = (float(arg) for arg in args)
+            stored = self.hashes.get(keys[0])
+            (tokens, updated_at), retry_after = take_token(stored, now, rate, int(burst))
+            self.hashes[keys[0]] = (tokens, updated_at)
+            self.expiry[keys[0]] = expire_ms
+            return str(retry_after).encode()
+
+        return run
+
+
+def test_redis_limiter_one_script_call_per_hit(clock):
+    redis_client = ScriptRedis()
+    limiter = RedisRateLimiter(redis_client, rate=2.0, burst=1)
+
+    assert asyncio.run(limiter.hit("user1")) == 0.0
+    assert asyncio.run(limiter.hit("user1")) == pytest.approx(0.5)
+    assert redis_client.calls == 2
+    assert redis_client.expiry == {"fastauth:ratelimit:user1": 500}
+
+
+def test_middleware_answers_429_with_retry_after(clock):
+    setup_token_manager(secret_key="test_secret_key")
+    app = FastAPI()
+    register_auth_middleware(app, rate_limiter=MemoryRateLimiter(rate=0.5, burst=2))
+
+    @app.get("/data")
+    async def data():
+        return {"ok": True}
+
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {generate_token(User(id='user123', username='test')).access_token}"}
+
+    assert client.get("/data", headers=headers).status_code == 200
+    assert client.get("/data", headers=headers).status_code == 200
+    response = client.get("/data", headers=headers)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
+    assert response.json() == {"detail": "Too many requests"}
+
+    # Anonymous requests aren't keyed on anything and pass through
+    assert client.get("/data").status_code == 200
+
+
+def test_rate_limit_by_must_be_known():
+    with pytest.raises(ValueError):
+        AuthMiddleware(FastAPI(), rate_limit_by="ip")
+
+
+def test_lazy_middleware_gives_garbage_tokens_no_bucket(clock):
+    setup_token_manager(secret_key="test_secret_key")
+    limiter = MemoryRateLimiter(rate=0.5, burst=1, shards=1)
+    app = FastAPI()
+    register_auth_middleware(app, lazy=True, rate_limiter=limiter)
+
+    @app.get("/data")
+    async def data():
+        return {"ok": True}
+
+    client = TestClient(app)
+    for i in range(5):
+        assert client.get("/data", headers={"Authorization": f"Bearer not a jwt {i}"}).status_code == 200
+    buckets, _ = limiter._shards[0]
+    assert buckets == {}
+
+    headers = {"Authorization": f"Bearer {generate_token(User(id='user123', username='test')).access_token}"}
+    assert client.get("/data", headers=headers).status_code == 200
+    assert client.get("/data", headers=headers).status_code == 429
+    assert len(buckets) == 1
@@ -1,8 +1,86 @@
+import asyncio
+import threading
+import time
 from datetime import UTC, datetime, timedelta
 
 import pytest
+from fastapi import HTTPException
 
-from fastauth.storage import RedisTokenStorage
+from fastauth.async_storage import AsyncRedisTokenStorage
+from fastauth.cache import VerifiedTokenCache
+from fastauth.models import User
+from fastauth.near_cache import UserStateNearCache
+from fastauth.storage import CSRF_VERIFY_SCRIPT, RedisTokenStorage
+from fastauth.token import TokenManager
+
+
+class MockPipeline:
+    """Queues commands and runs them against the mock on execute"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        self.redis.round_trips += 1
+        results = [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+class MockPubSub:
+    """Delivers published messages to subscribed handlers synchronously"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.exception_handler = None
+
+    def subscribe(self, **handlers):
+        for channel, handler in handlers.items():
+            self.redis.subscribers.setdefault(channel, []).append(handler)
+
+    def run_in_thread(self, sleep_time=0.0, daemon=False, exception_handler=None):
+        self.exception_handler = exception_handler
+        return self
+
+    def stop(self):
+        pass
+
+
+def run_csrf_verify(redis, keys, args):
+    """Python rendering of CSRF_VERIFY_SCRIPT"""
+    token = redis.data.get(keys[0])
+    if not token:
+        return 0
+    if float(token["expires_at"]) < float(args[0]):
+        redis.delete(keys[0])
+        return 0
+    if str(token["used"]) == "1":
+        return 0
+    if str(args[1]) == "1":
+        token["used"] = 1
+    return 1
+
+
+class MockScript:
+    """Runs a registered script's Python rendering, counting it as one round trip"""
+
+    scripts = {CSRF_VERIFY_SCRIPT: run_csrf_verify}
+
+    def __init__(self, redis, script):
+        self.redis = redis
+        self.run = self.scripts[script]
+
+    def __call__(self, keys=(), args=()):
+        self.redis.round_trips += 1
+        return self.run(self.redis, keys, args)
 
 
 class MockRedis:
@@ -11,16 +89,49 @@ class MockRedis:
     def __init__(self):
         self.data = {}
         self.expiry = {}
+        self.round_trips = 0
+        self.subscribers = {}
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return MockPubSub(self)
+
+    def publish(self, channel, message):
+        for handler in self.subscribers.get(channel, []):
+            handler({"type": "message", "channel": channel, "data": message.encode()})
+        return len(self.subscribers.get(channel, []))
 
-    def set(self, key, value, ex=None):
+    def pipeline(self, transaction=True):
+        return MockPipeline(self)
+
+    def register_script(self, script):
+        return MockScript(self, script)
+
+    def set(self, key, value, ex=None, px=None):
         self.data[key] = value
+        self.expiry.pop(key, None)
         if ex is not None:
             self.expiry[key] = ex
+        if px is not None:
+            self.expiry[key] = px / 1000
         return True
 
+    def pttl(self, key):
+        if key not in self.data:
+            return -2
+        if key not in self.expiry:
+            return -1
+        return int(self.expiry[key] * 1000)
+
+    def scan_iter(self, match=None, count=None):
+        prefix = (match or "*").replace("*", "")
+        return [k for k in list(self.data) if k.startswith(prefix)]
+
     def get(self, key):
         return self.data.get(key)
 
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
     def exists(self, key):
         return key in self.data
 
@@ -61,10 +172,64 @@ class MockRedis:
         prefix = pattern.replace("*", "")
         return [k for k in self.data if k.startswith(prefix)]
 
-    def delete(self, key):
-        if key in self.data:
-            del self.data[key]
-        return 1
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+        return len(mapping)
+
+    def zrangebyscore(self, key, min, max):
+        scores = self.data.get(key, {})
+        return [member.encode() for member in sorted(scores, key=scores.get) if scores[member] <= max]
+
+    def zremrangebyscore(self, key, min, max):
+        scores = self.data.get(key, {})
+        expired = [member for member, score in scores.items() if score <= max]
+        for member in expired:
+            del scores[member]
+        return len(expired)
+
+    def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if key in self.data:
+                del self.data[key]
+                deleted += 1
+            self.expiry.pop(key, None)
+        return deleted
+
+
+class AsyncMockPipeline(MockPipeline):
+    async def execute(self):
+        return super().execute()
+
+
+class AsyncMockRedis:
+    """Exposes a MockRedis through the redis.asyncio interface"""
+
+    def __init__(self, redis):
+        self.sync = redis
+
+    def pipeline(self, transaction=True):
+        return AsyncMockPipeline(self.sync)
+
+    def register_script(self, script):
+        sync_script = self.sync.register_script(script)
+
+        async def run(keys=(), args=()):
+            return sync_script(keys=keys, args=args)
+
+        return run
+
+    async def scan_iter(self, match=None, count=None):
+        for key in self.sync.scan_iter(match=match, count=count):
+            yield key
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def command(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return command
 
 
 @pytest.fixture
@@ -131,6 +296,82 @@ def test_redis_token_versioning(redis_storage):
     assert redis_storage.get_user_token_version("user1") == 2
 
 
+def test_redis_revocations_keyed_by_digest(redis_storage):
+    token = "header." + "p" * 400 + ".signature"
+    redis_storage.add_revoked_token(token, "user1")
+
+    # Only one fixed-size key per revocation, the token itself is never stored
+    assert len(redis_storage.redis.data) == 1
+    assert all(token not in key for key in redis_storage.redis.data)
+    assert redis_storage.is_token_revoked(token, "user1") is True
+
+
+def test_redis_revocation_ttl_matches_token_expiry(redis_storage):
+    redis_storage.add_revoked_token("live", "user1", expires_at=time.time() + 120)
+    redis_storage.add_revoked_token("expired", "user1", expires_at=time.time() - 1)
+
+    # Kept exactly as long as the token is valid, already expired tokens are not stored
+    assert redis_storage.redis.expiry[redis_storage._revoked_key("live")] in (120, 121)
+    assert redis_storage._revoked_key("expired") not in redis_storage.redis.data
+
+
+def test_redis_migrate_legacy_revocation_keys(redis_client):
+    legacy_storage = RedisTokenStorage(redis_client, legacy_revocation_keys=True)
+    redis_client.set(f"{legacy_storage.prefix}revoked:legacy.token.one", "1", ex=120)
+    redis_client.sadd(f"{legacy_storage.prefix}user_revoked:user1", "legacy.token.one")
+    legacy_storage.add_revoked_token("new.token.two")
+
+    # During the transition both layouts are honoured
+    assert legacy_storage.is_token_revoked("legacy.token.one", "user1") is True
+    assert RedisTokenStorage(redis_client).is_token_revoked("legacy.token.one", "user1") is False
+
+    assert legacy_storage.migrate_revocation_keys() == 1
+
+    storage = RedisTokenStorage(redis_client)
+    assert storage.is_token_revoked("legacy.token.one", "user1") is True
+    assert storage.is_token_revoked("new.token.two") is True
+    assert redis_client.pttl(storage._revoked_key("legacy.token.one")) == 120_000
+    assert not any("legacy.token.one" in key or "user_revoked" in key for key in redis_client.data)
+
+
+def test_redis_bulk_token_versions(redis_storage):
+    redis_storage.increment_user_token_version("user2")
+
+    assert redis_storage.get_user_token_versions(["user1", "user2"]) == {"user1": 0, "user2": 1}
+    assert redis_storage.get_user_token_versions([]) == {}
+
+
+def test_redis_token_states_in_one_round_trip(redis_storage):
+    redis_storage.add_revoked_token("token1", "user1")
+    redis_storage.increment_user_token_version("user2")
+    redis_storage.redis.round_trips = 0
+
+    states = redis_storage.get_token_states([("token1", "user1"), ("token2", "user2"), ("token3", None)])
+
+    assert states == [(True, 0), (False, 1), (False, 0)]
+    assert redis_storage.redis.round_trips == 1
+
+
+def test_redis_token_state(redis_storage):
+    redis_storage.add_revoked_token("token1", "user1")
+    redis_storage.increment_user_token_version("user1")
+    redis_storage.redis.round_trips = 0
+
+    assert redis_storage.get_token_state("token1", "user1") == (True, 1)
+    assert redis_storage.get_token_state("token2", "user1") == (False, 1)
+    assert redis_storage.get_token_state("token2") == (False, 0)
+    assert redis_storage.redis.round_trips == 3
+
+
+def test_redis_verify_token_uses_one_round_trip(redis_storage):
+    manager = TokenManager(secret_key="test_secret_key", token_storage=redis_storage)
+    tokens = manager.generate_tokens(User(id="user1", username="testuser"))
+    redis_storage.redis.round_trips = 0
+
+    assert manager.verify_token(tokens.access_token).user_id == "user1"
+    assert redis_storage.redis.round_trips == 1
+
+
 def test_redis_csrf_token_storage(redis_storage):
     user_id = "user1"
     token_hash = "hash123"
@@ -151,3 +392,242 @@ def test_redis_csrf_token_storage(redis_storage):
 
     # Verify for wrong user fails
     assert redis_storage.verify_csrf_token("wrong_user", token_hash) is False
+
+
+def test_async_redis_storage_shares_keys(redis_client, redis_storage):
+    async_storage = AsyncRedisTokenStorage(AsyncMockRedis(redis_client))
+
+    async def scenario():
+        await async_storage.add_revoked_token("token1", "user1")
+        assert await async_storage.is_token_revoked("token1", "user1") is True
+        assert await async_storage.is_token_revoked("token2", "user1") is False
+
+        assert await async_storage.increment_user_token_version("user2") == 1
+        assert await async_storage.get_user_token_version("user2") == 1
+        assert await async_storage.get_token_states([("token1", "user1"), ("token2", "user2")]) == [
+            (True, 0),
+            (False, 1),
+        ]
+
+    asyncio.run(scenario())
+
+    # The sync storage sees the same state
+    assert redis_storage.is_token_revoked("token1", "user1") is True
+    assert redis_storage.get_user_token_version("user2") == 1
+
+
+@pytest.fixture
+def near_cached_storages(redis_client):
+    """Two storages sharing one Redis, as if running in two processes"""
+    storages = []
+    for _ in range(2):
+        near_cache = UserStateNearCache(redis_client)
+        near_cache.start()
+        storages.append(RedisTokenStorage(redis_client, near_cache=near_cache))
+    return storages
+
+
+def test_near_cache_serves_versions_locally(redis_client, near_cached_storages):
+    storage, _ = near_cached_storages
+    storage.increment_user_token_version("user1")
+
+    assert storage.get_user_token_version("user1") == 1
+    redis_client.round_trips = 0
+    assert storage.get_user_token_version("user1") == 1
+    assert storage.get_user_token_versions(["user1"]) == {"user1": 1}
+    assert redis_client.round_trips == 0
+
+
+def test_near_cache_invalidated_across_processes(near_cached_storages):
+    first, second = near_cached_storages
+    invalidated = []
+    first.add_invalidation_listener(lambda token, user_id: invalidated.append(user_id))
+    assert first.get_token_state("token1", "user1") == (False, 0)
+
+    second.increment_user_token_version("user1")
+    assert first.get_user_token_version("user1") == 1
+    assert "user1" in invalidated
+
+    second.revoke_all_user_tokens("user1")
+    assert first.get_token_state("token1", "user1") == (True, 2)
+
+
+def test_revocations_drop_verified_tokens_across_processes(near_cached_storages):
+    managers = [
+        TokenManager(secret_key="test_secret_key", token_storage=storage, verify_cache=VerifiedTokenCache())
+        for storage in near_cached_storages
+    ]
+    token = managers[0].generate_tokens(User(id="user1", username="testuser")).access_token
+    managers[0].verify_token(token)
+    assert len(managers[0].verify_cache) == 1
+
+    managers[1].revoke_token(token)
+
+    assert len(managers[0].verify_cache) == 0
+    with pytest.raises(HTTPException):
+        managers[0].verify_token(token)
+
+
+def test_async_storage_shares_the_near_cache_protocol(redis_client, near_cached_storages):
+    storage, _ = near_cached_storages
+    near_cache = UserStateNearCache(redis_client)
+    near_cache.start()
+    async_storage = AsyncRedisTokenStorage(AsyncMockRedis(redis_client), near_cache=near_cache)
+
+    async def scenario():
+        assert await async_storage.get_token_state("token1", "user1") == (False, 0)
+        redis_client.round_trips = 0
+        assert await async_storage.get_user_token_version("user1") == 0
+        assert redis_client.round_trips == 0
+
+        # Flag, version bump and publish go out together
+        await async_storage.revoke_all_user_tokens("user1")
+        assert redis_client.round_trips == 1
+        assert await async_storage.get_token_state("token1", "user1") == (True, 1)
+
+    storage.get_user_token_version("user1")
+    asyncio.run(scenario())
+    assert storage.get_token_state("token1", "user1") == (True, 1)
+
+
+def test_near_cache_bypassed_when_subscription_drops(redis_client, near_cached_storages):
+    storage, _ = near_cached_storages
+    near_cache = storage.near_cache
+    storage.get_user_token_version("user1")
+    assert len(near_cache) == 1
+
+    near_cache._handle_subscription_error(ConnectionError("lost"), None, MockPubSub(redis_client))
+
+    # Changes published while disconnected are missed, so reads go straight to Redis
+    redis_client.incr(f"{storage.prefix}token_version:user1")
+    assert len(near_cache) == 0
+    assert storage.get_user_token_version("user1") == 1
+    assert len(near_cache) == 0
+    near_cache.stop()
+
+
+def test_near_cache_resubscribes_in_the_background(redis_client, monkeypatch):
+    attempts = []
+    pubsub = redis_client.pubsub
+
+    def flaky_pubsub(**kwargs):
+        attempts.append(threading.current_thread())
+        if len(attempts) == 1:
+            raise ConnectionError("Redis is down")
+        return pubsub(**kwargs)
+
+    monkeypatch.setattr(redis_client, "pubsub", flaky_pubsub)
+    near_cache = UserStateNearCache(redis_client, resubscribe_interval=0.05)
+    near_cache.start()
+    retry = near_cache._retry_timer
+
+    # Reads never try to connect themselves
+    assert near_cache.get("user1") is None
+    assert len(attempts) == 1
+
+    retry.join(1)
+    assert near_cache.enabled() is True
+    assert attempts[1] is not threading.main_thread()
+    near_cache.stop()
+
+
+def test_near_cache_is_bounded(redis_client):
+    near_cache = UserStateNearCache(redis_client, max_size=2)
+    near_cache.start()
+    for user_id in ("user1", "user2", "user3"):
+        near_cache.put(user_id, False, 0, near_cache.generation)
+
+    assert len(near_cache) == 2
+    assert near_cache.get("user1") is None
+
+
+def store_csrf_tokens(storage, user_id, expired, valid):
+    now = datetime.now(UTC)
+    for token_hash in expired:
+        storage.store_csrf_token(user_id, token_hash, now - timedelta(hours=1))
+    for token_hash in valid:
+        storage.store_csrf_token(user_id, token_hash, now + timedelta(hours=1))
+
+
+def test_redis_csrf_cleanup_uses_the_expiry_index(redis_client, redis_storage):
+    store_csrf_tokens(redis_storage, "user1", expired=["old1", "old2"], valid=["new"])
+    store_csrf_tokens(redis_storage, "user2", expired=["old"], valid=[])
+    assert set(redis_client.data[f"{redis_storage.prefix}csrf_index:user1"]) == {"old1", "old2", "new"}
+
+    redis_client.round_trips = 0
+    redis_storage.clear_old_csrf_tokens("user1")
+
+    # One pipelined index read, then a single delete
+    assert redis_client.round_trips == 1
+    assert f"{redis_storage.prefix}csrf:user1:old1" not in redis_client.data
+    assert f"{redis_storage.prefix}csrf:user1:old2" not in redis_client.data
+    assert redis_storage.verify_csrf_token("user1", "new") is True
+    assert set(redis_client.data[f"{redis_storage.prefix}csrf_index:user1"]) == {"new"}
+    # Other users are left alone
+    assert f"{redis_storage.prefix}csrf:user2:old" in redis_client.data
+
+
+def test_redis_global_csrf_cleanup_walks_every_index(redis_client, redis_storage, monkeypatch):
+    monkeypatch.setattr(redis_client, "keys", None)
+    store_csrf_tokens(redis_storage, "user1", expired=["old"], valid=["new"])
+    store_csrf_tokens(redis_storage, "user2", expired=["old"], valid=[])
+
+    redis_storage.clear_old_csrf_tokens()
+
+    csrf_keys = {key for key in redis_client.data if ":csrf:" in key}
+    assert csrf_keys == {f"{redis_storage.prefix}csrf:user1:new"}
+
+
+def test_async_redis_csrf_cleanup(redis_client):
+    storage = AsyncRedisTokenStorage(AsyncMockRedis(redis_client))
+
+    async def scenario():
+        now = datetime.now(UTC)
+        await storage.store_csrf_token("user1", "old", now - timedelta(hours=1))
+        await storage.store_csrf_token("user1", "new", now + timedelta(hours=1))
+        await storage.store_csrf_token("user2", "old", now - timedelta(hours=1))
+
+        await storage.clear_old_csrf_tokens("user1")
+        assert f"{storage.prefix}csrf:user1:old" not in redis_client.data
+        assert f"{storage.prefix}csrf:user2:old" in redis_client.data
+
+        await storage.clear_old_csrf_tokens()
+        assert f"{storage.prefix}csrf:user2:old" not in redis_client.data
+        assert await storage.verify_csrf_token("user1", "new") is True
+
+    asyncio.run(scenario())
+
+
+def test_redis_csrf_verify_is_one_round_trip(redis_client, redis_storage):
+    redis_storage.store_csrf_token("user1", "hash", datetime.now(UTC) + timedelta(hours=1))
+    redis_client.round_trips = 0
+
+    assert redis_storage.verify_csrf_token("user1", "hash") is True
+    assert redis_storage.verify_csrf_token("user1", "hash", consume=True) is True
+    # Consumed tokens can't be replayed
+    assert redis_storage.verify_csrf_token("user1", "hash") is False
+    assert redis_client.round_trips == 3
+
+
+def test_redis_csrf_store_is_one_round_trip(redis_client, redis_storage):
+    redis_client.round_trips = 0
+    redis_storage.store_csrf_token("user1", "hash", datetime.now(UTC) + timedelta(hours=1))
+    assert redis_client.round_trips == 1
+
+
+def test_redis_csrf_verify_drops_expired_tokens(redis_client, redis_storage):
+    redis_storage.store_csrf_token("user1", "hash", datetime.now(UTC) - timedelta(seconds=1))
+
+    assert redis_storage.verify_csrf_token("user1", "hash") is False
+    assert f"{redis_storage.prefix}csrf:user1:hash" not in redis_client.data
+
+
+def test_async_redis_csrf_consume(redis_client):
+    storage = AsyncRedisTokenStorage(AsyncMockRedis(redis_client))
+
+    async def scenario():
+        await storage.store_csrf_token("user1", "hash", datetime.now(UTC) + timedelta(hours=1))
+        assert await storage.verify_csrf_token("user1", "hash", consume=True) is True
+        assert await storage.verify_csrf_token("user1", "hash", consume=True) is False
+
+    asyncio.run(scenario())
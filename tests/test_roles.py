@@ -0,0 +1,83 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from fastauth.dependencies import require_role
+from fastauth.models import TokenData, User
+from fastauth.roles import RoleCatalogue, role_catalogue
+from fastauth.token import generate_token, setup_token_manager
+
+
+def test_bits_are_assigned_once_per_role():
+    catalogue = RoleCatalogue()
+
+    admin = catalogue.bit("admin")
+    user = catalogue.bit("user")
+
+    assert admin != user
+    assert catalogue.bit("admin") == admin
+    assert catalogue.required_mask(["admin", "user"]) == admin | user
+
+
+def test_mask_expands_the_hierarchy():
+    catalogue = RoleCatalogue()
+    catalogue.register("superuser", implies=["admin"])
+    catalogue.register("admin", implies=["user", "auditor"])
+
+    mask = catalogue.mask(["superuser"])
+
+    assert mask == catalogue.required_mask(["superuser", "admin", "user", "auditor"])
+    assert catalogue.mask(["user"]) == catalogue.bit("user")
+
+
+def test_cyclic_hierarchy_terminates():
+    catalogue = RoleCatalogue()
+    catalogue.register("a", implies=["b"])
+    catalogue.register("b", implies=["a"])
+
+    assert catalogue.mask(["a"]) == catalogue.required_mask(["a", "b"])
+
+
+def test_registering_a_hierarchy_resets_cached_masks():
+    catalogue = RoleCatalogue()
+    assert catalogue.mask(["owner"]) == catalogue.bit("owner")
+
+    catalogue.register("owner", implies=["member"])
+
+    assert catalogue.mask(["owner"]) == catalogue.required_mask(["owner", "member"])
+
+
+def test_token_data_carries_its_role_mask():
+    token_data = TokenData(user_id="user123", roles=["mask-test-role"])
+
+    assert token_data.role_mask
+    assert "role_mask" not in token_data.model_dump()
+
+
+@pytest.fixture
+def client():
+    setup_token_manager(secret_key="test_secret_key")
+    role_catalogue.register("test-owner", implies=["test-editor"])
+
+    app = FastAPI()
+
+    @app.get("/edit")
+    async def edit(token_data=Depends(require_role(["test-editor"]))):
+        return {"user_id": token_data.user_id}
+
+    @app.get("/edit-and-review")
+    async def edit_and_review(token_data=Depends(require_role(["test-editor", "test-reviewer"], require_all=True))):
+        return {"user_id": token_data.user_id}
+
+    return TestClient(app)
+
+
+def test_require_role_honours_the_hierarchy(client):
+    def headers(roles):
+        token = generate_token(User(id="user123", username="testuser", roles=roles)).access_token
+        return {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/edit", headers=headers(["test-owner"])).status_code == 200
+    assert client.get("/edit", headers=headers(["test-reviewer"])).status_code == 403
+    assert client.get("/edit-and-review", headers=headers(["test-owner"])).status_code == 403
+    assert client.get("/edit-and-review", headers=headers(["test-owner", "test-reviewer"])).status_code == 200
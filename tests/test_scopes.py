@@ -0,0 +1,78 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from fastauth.dependencies import require_scopes
+from fastauth.models import User
+from fastauth.scopes import ScopeMatcher
+from fastauth.token import generate_token, setup_token_manager, verify_token
+
+
+@pytest.mark.parametrize(
+    "scope, expected",
+    [
+        ("orders:read", True),
+        ("orders:write", False),
+        ("orders", False),
+        ("billing:read", True),
+        ("billing:invoices:write", True),
+        ("users:42:read", True),
+        ("users:42:write", False),
+        ("users:42:profile:read", False),
+        ("reports:read", False),
+    ],
+)
+def test_matcher_segments_and_wildcards(scope, expected):
+    matcher = ScopeMatcher(["orders:read", "billing:*", "users:*:read"])
+    assert matcher.allows(scope) is expected
+
+
+def test_matcher_with_many_scopes():
+    matcher = ScopeMatcher([f"service{i}:resource{j}:read" for i in range(20) for j in range(20)])
+
+    assert matcher.allows("service19:resource19:read")
+    assert not matcher.allows("service19:resource19:write")
+    assert matcher.allows_any(["nope:read", "service0:resource0:read"])
+    assert not matcher.allows_all(["nope:read", "service0:resource0:read"])
+
+
+def test_scopes_claim_round_trip():
+    setup_token_manager(secret_key="test_secret_key")
+
+    scoped = generate_token(User(id="user123", username="testuser", scopes=["orders:*"]))
+    token_data = verify_token(scoped.access_token)
+    assert token_data.scopes == ["orders:*"]
+    # The matcher is compiled once per scope set, not per verification
+    assert token_data.scope_matcher is verify_token(scoped.access_token).scope_matcher
+    other = generate_token(User(id="user789", username="third", scopes=["orders:*"]))
+    assert verify_token(other.access_token).scope_matcher is token_data.scope_matcher
+
+    unscoped = generate_token(User(id="user456", username="other"))
+    assert verify_token(unscoped.access_token).scopes == []
+
+
+def test_require_scopes():
+    setup_token_manager(secret_key="test_secret_key")
+    app = FastAPI()
+
+    @app.get("/orders")
+    async def orders(token_data=Depends(require_scopes(["orders:read", "orders:list"]))):
+        return {"user_id": token_data.user_id}
+
+    @app.get("/reports")
+    async def reports(token_data=Depends(require_scopes(["reports:read", "orders:read"], require_all=False))):
+        return {"user_id": token_data.user_id}
+
+    client = TestClient(app)
+
+    def headers(scopes):
+        token = generate_token(User(id="user123", username="testuser", scopes=scopes)).access_token
+        return {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/orders").status_code == 401
+    assert client.get("/orders", headers=headers(["orders:*"])).status_code == 200
+    response = client.get("/orders", headers=headers(["orders:read"]))
+    assert response.status_code == 403
+    assert response.json() == {"detail": "Insufficient scope. Required scopes: orders:read, orders:list"}
+    assert client.get("/reports", headers=headers(["orders:read"])).status_code == 200
+    assert client.get("/reports", headers=headers(["billing:read"])).status_code == 403
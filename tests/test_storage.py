@@ -1,3 +1,4 @@
+import time
 from datetime import UTC, datetime, timedelta
 
 import pytest
@@ -47,6 +48,31 @@ def test_revoke_all_user_tokens(memory_storage):
     assert memory_storage.is_token_revoked("different_token", "user2") is False
 
 
+def test_revocations_stored_as_digests(memory_storage):
+    token = "header." + "p" * 400 + ".signature"
+    memory_storage.add_revoked_token(token, "user1")
+
+    assert memory_storage.is_token_revoked(token, "user1") is True
+    assert token not in memory_storage._revoked_tokens
+    assert all(len(entry) == 16 for entry in memory_storage._revoked_tokens)
+
+
+def test_revocations_expire_with_the_token(memory_storage):
+    now = time.time()
+    memory_storage.add_revoked_token("live", "user1", expires_at=now + 60)
+    memory_storage.add_revoked_token("expired", "user1", expires_at=now - 1)
+
+    assert memory_storage.is_token_revoked("live", "user1") is True
+    assert memory_storage.is_token_revoked("expired", "user1") is False
+
+    # Expired entries are dropped, live ones kept
+    memory_storage.clear_expired_tokens(now)
+    assert len(memory_storage._revoked_tokens) == 1
+
+    memory_storage.clear_expired_tokens(now + 61)
+    assert len(memory_storage._revoked_tokens) == 0
+
+
 def test_token_versioning(memory_storage):
     # Check default version
     assert memory_storage.get_user_token_version("user1") == 0
@@ -115,3 +141,125 @@ def test_clear_old_csrf_tokens(memory_storage):
     # Verify expired token is gone, valid token remains
     assert memory_storage.verify_csrf_token(user_id, expired_token) is False
     assert memory_storage.verify_csrf_token(user_id, valid_token) is True
+
+
+def test_sweep_drops_expired_entries_only():
+    storage = MemoryTokenStorage()
+    now = time.time()
+    storage.add_revoked_token("old", expires_at=now - 10)
+    storage.add_revoked_token("new", expires_at=now + 3600)
+    storage.store_csrf_token("user1", "old_hash", datetime.now(UTC) - timedelta(hours=1))
+    storage.store_csrf_token("user2", "new_hash", datetime.now(UTC) + timedelta(hours=1))
+
+    storage.clear_expired_tokens(now)
+    storage.clear_old_csrf_tokens()
+
+    assert len(storage._revoked_tokens) == 1
+    assert "user1" not in storage._csrf_tokens
+    assert storage.verify_csrf_token("user2", "new_hash") is True
+    # CSRF tokens are never put in the revocation index
+    assert len(storage._expiry) == 1
+
+
+def test_re_revoking_a_token_keeps_the_later_expiry():
+    storage = MemoryTokenStorage()
+    now = time.time()
+    storage.add_revoked_token("token", expires_at=now + 1)
+    storage.add_revoked_token("token", expires_at=now + 3600)
+
+    # The stale index entry for the first expiry must not drop the revocation
+    storage.clear_expired_tokens(now + 2)
+
+    assert storage.is_token_revoked("token") is True
+
+
+def test_writes_sweep_a_bounded_number_of_entries():
+    storage = MemoryTokenStorage()
+    past = time.time() - 10
+    for i in range(10):
+        storage._revoked_tokens[str(i).encode()] = past
+        storage._expiry.add(past, ("revoked", str(i).encode()))
+
+    storage.add_revoked_token("fresh")
+
+    assert len(storage._revoked_tokens) == 10 - MemoryTokenStorage._SWEEP_ON_WRITE + 1
+
+
+def test_sweep_stops_at_its_time_budget():
+    storage = MemoryTokenStorage(sweep_budget=0)
+    past = time.time() - 10
+    for i in range(1000):
+        storage._revoked_tokens[str(i).encode()] = past
+        storage._expiry.add(past, ("revoked", str(i).encode()))
+
+    storage.clear_expired_tokens(time.time())
+    assert 0 < len(storage._revoked_tokens) < 1000
+
+    storage.sweep_budget = 1.0
+    storage.clear_expired_tokens(time.time())
+    assert not storage._revoked_tokens
+
+
+def test_consumed_csrf_token_cannot_be_reused(memory_storage):
+    memory_storage.store_csrf_token("user1", "hash", datetime.now(UTC) + timedelta(hours=1))
+
+    assert memory_storage.verify_csrf_token("user1", "hash", consume=True) is True
+    assert memory_storage.verify_csrf_token("user1", "hash") is False
+
+    # Used tokens are dropped by a per-user cleanup
+    memory_storage.clear_old_csrf_tokens("user1")
+    assert "user1" not in memory_storage._csrf_tokens
+
+
+def test_csrf_tokens_per_user_evicts_oldest():
+    storage = MemoryTokenStorage(csrf_tokens_per_user=3)
+    expires_at = datetime.now(UTC) + timedelta(hours=1)
+    for i in range(5):
+        storage.store_csrf_token("user1", f"hash{i}", expires_at)
+
+    assert list(storage._csrf_tokens["user1"]) == ["hash2", "hash3", "hash4"]
+    assert storage.verify_csrf_token("user1", "hash0") is False
+    assert storage.verify_csrf_token("user1", "hash4") is True
+
+    # Storing a known token again makes it the newest
+    storage.store_csrf_token("user1", "hash2", expires_at)
+    storage.store_csrf_token("user1", "hash5", expires_at)
+    assert list(storage._csrf_tokens["user1"]) == ["hash4", "hash2", "hash5"]
+
+    # Index entries of evicted tokens are skipped by the sweep
+    storage.clear_expired_tokens(expires_at.timestamp() + 1)
+    assert "user1" not in storage._csrf_tokens
+
+    with pytest.raises(ValueError):
+        MemoryTokenStorage(csrf_tokens_per_user=0)
+
+
+def test_csrf_generation_keeps_memory_flat():
+    storage = MemoryTokenStorage(csrf_tokens_per_user=4)
+    expires_at = datetime.now(UTC) + timedelta(hours=24)
+    for i in range(10_000):
+        storage.store_csrf_token("user1", f"hash{i}", expires_at)
+
+    assert len(storage._csrf_tokens["user1"]) == 4
+    assert len(storage._expiry) == 0
+
+
+def test_csrf_store_drops_expired_tokens_from_the_front():
+    storage = MemoryTokenStorage()
+    storage.store_csrf_token("user1", "old", datetime.now(UTC) - timedelta(seconds=1))
+    assert "user1" not in storage._csrf_tokens
+
+    storage.store_csrf_token("user1", "short", datetime.now(UTC) + timedelta(seconds=1))
+    storage.store_csrf_token("user1", "long", datetime.now(UTC) + timedelta(hours=1))
+    storage._csrf_tokens["user1"]["short"] = time.time() - 1
+    storage.store_csrf_token("user1", "new", datetime.now(UTC) + timedelta(hours=1))
+    assert list(storage._csrf_tokens["user1"]) == ["long", "new"]
+
+
+def test_sweep_expires_csrf_tokens_of_idle_users():
+    storage = MemoryTokenStorage()
+    for user_id in ("user1", "user2"):
+        storage.store_csrf_token(user_id, "hash", datetime.now(UTC) + timedelta(hours=1))
+
+    storage.clear_expired_tokens(time.time() + 7200)
+    assert storage._csrf_tokens == {}
@@ -0,0 +1,143 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from fastauth.storage import MemoryTokenStorage
+from fastauth.tiered_storage import _MISSING, TieredTokenStorage, TierPolicy
+from fastauth.token import TokenManager
+
+
+class CountingStorage(MemoryTokenStorage):
+    """Memory storage standing in for a remote one, counting the calls that reach it"""
+
+    performs_io = True
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self._depth = 0
+
+    def _count(self, method, *args):
+        # Only record the outermost call, the memory methods call each other
+        if not self._depth:
+            self.calls.append(method)
+        self._depth += 1
+        try:
+            return getattr(super(), method)(*args)
+        finally:
+            self._depth -= 1
+
+    def get_token_state(self, token, user_id=None):
+        return self._count("get_token_state", token, user_id)
+
+    def get_token_states(self, tokens):
+        return self._count("get_token_states", tokens)
+
+    def get_user_token_version(self, user_id):
+        return self._count("get_user_token_version", user_id)
+
+    def verify_csrf_token(self, user_id, token_hash, consume=False):
+        return self._count("verify_csrf_token", user_id, token_hash, consume)
+
+
+@pytest.fixture
+def remote():
+    return CountingStorage()
+
+
+@pytest.fixture
+def storage(remote):
+    return TieredTokenStorage(remote)
+
+
+def test_reads_are_served_locally(remote, storage):
+    assert storage.get_token_state("token", "user1") == (False, 0)
+    assert storage.get_token_state("token", "user1") == (False, 0)
+    assert storage.get_user_token_version("user1") == 0
+
+    assert remote.calls == ["get_token_state"]
+    assert storage.performs_io is True
+    stats = storage.stats()
+    assert stats["is_token_revoked"] == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+    assert stats["get_user_token_version"]["hits"] == 2
+
+
+def test_writes_go_through_to_both_tiers(remote, storage):
+    storage.get_token_state("token", "user1")
+
+    storage.add_revoked_token("token", "user1")
+    assert remote.is_token_revoked("token", "user1") is True
+    assert storage.get_token_state("token", "user1") == (True, 0)
+
+    assert storage.increment_user_token_version("user1") == 1
+    assert storage.get_user_token_version("user1") == 1
+    assert remote.calls == ["get_token_state"]
+
+
+def test_remote_invalidations_drop_local_entries(remote, storage):
+    storage.get_token_state("token", "user1")
+
+    # Written straight to the remote, e.g. by another process with a near cache
+    remote.revoke_all_user_tokens("user1")
+
+    assert storage.get_token_state("token", "user1") == (True, 1)
+    assert len(remote.calls) == 2
+
+
+def test_negative_answers_expire_quickly(remote):
+    storage = TieredTokenStorage(remote, policies={"is_token_revoked": TierPolicy(ttl=60, negative_ttl=0)})
+    storage.is_token_revoked("token")
+    storage.add_revoked_token("other")
+
+    # Only the positive answer is still fresh
+    assert storage._get("is_token_revoked", storage._revoked_key("token", None)) is _MISSING
+    assert storage.is_token_revoked("other") is True
+    assert storage.stats()["is_token_revoked"]["hits"] == 1
+
+
+def test_policies(remote):
+    storage = TieredTokenStorage(remote, policies={"get_user_token_version": None})
+    storage.get_user_token_version("user1")
+    storage.get_user_token_version("user1")
+    assert remote.calls == ["get_user_token_version", "get_user_token_version"]
+
+    with pytest.raises(ValueError):
+        TieredTokenStorage(remote, policies={"verify_csrf_token": TierPolicy(ttl=1, negative_ttl=1)})
+
+
+def test_csrf_verification_is_never_cached(remote, storage):
+    storage.store_csrf_token("user1", "hash", datetime.now(UTC) + timedelta(hours=1))
+
+    assert storage.verify_csrf_token("user1", "hash", consume=True) is True
+    assert storage.verify_csrf_token("user1", "hash", consume=True) is False
+    assert remote.calls == ["verify_csrf_token", "verify_csrf_token"]
+
+
+def test_batched_misses_take_one_remote_call(remote, storage):
+    storage.get_token_state("a", "user1")
+    remote.calls.clear()
+
+    states = storage.get_token_states([("a", "user1"), ("b", "user2"), ("c", "user3")])
+    assert states == [(False, 0), (False, 0), (False, 0)]
+    assert remote.calls == ["get_token_states"]
+
+
+def test_max_size(remote):
+    storage = TieredTokenStorage(remote, max_size=2)
+    for user_id in ("user1", "user2", "user3"):
+        storage.get_user_token_version(user_id)
+    assert storage.size == 2
+
+
+def test_token_manager_with_tiered_storage(remote, storage):
+    manager = TokenManager(secret_key="test_secret_key", token_storage=storage)
+    token = manager.create_access_token({"sub": "user1", "username": "test", "roles": []})
+
+    manager.verify_token(token)
+    manager.verify_token(token)
+    assert remote.calls.count("get_token_state") == 1
+
+    manager.revoke_token(token)
+    with pytest.raises(HTTPException):
+        manager.verify_token(token)
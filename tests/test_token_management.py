@@ -1,16 +1,29 @@
+import asyncio
+import threading
+
 import pytest
 from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
 
-from fastauth.models import User
+from fastauth.async_storage import SyncTokenStorageAdapter
+from fastauth.models import FastTokenData, TokenData, User
+from fastauth.storage import MemoryTokenStorage
 from fastauth.token import (
+    _ensure_token_manager,
+    agenerate_token,
+    arefresh_token,
+    arevoke_token,
+    averify_token,
     clear_expired_revocations,
     generate_token,
+    generate_tokens_many,
     is_token_revoked,
     revoke_all_user_tokens,
     revoke_token,
     rotate_user_tokens,
     setup_token_manager,
     verify_token,
+    verify_tokens_many,
 )
 
 
@@ -58,6 +71,16 @@ def test_token_revocation(test_user):
     assert excinfo.value.status_code == 401
 
 
+def test_revocation_carries_token_expiry(test_user):
+    manager = _ensure_token_manager()
+    access_token = generate_token(test_user).access_token
+    exp = manager.codec.decode(access_token)["exp"]
+
+    revoke_token(access_token)
+
+    assert list(manager.token_storage._revoked_tokens.values()) == [exp]
+
+
 def test_revoke_all_user_tokens(test_user):
     # Generate multiple tokens for the same user
     token1 = generate_token(test_user)
@@ -112,3 +135,110 @@ def test_clear_expired_revocations():
     # we can't easily test the actual clearing functionality
     clear_expired_revocations()
     assert True  # Test passes if no exceptions are raised
+
+
+def test_generate_tokens_many(test_user, admin_user):
+    storage = _ensure_token_manager().token_storage
+    storage.increment_user_token_version(admin_user.id)
+
+    responses = generate_tokens_many([test_user, admin_user])
+
+    # Responses come back in order and carry each user's current version
+    assert [verify_token(r.access_token).user_id for r in responses] == [test_user.id, admin_user.id]
+    assert verify_token(responses[1].refresh_token).user_id == admin_user.id
+
+
+def test_generate_tokens_many_reads_versions_once(test_user, admin_user, monkeypatch):
+    storage = _ensure_token_manager().token_storage
+    calls = []
+    monkeypatch.setattr(storage, "get_user_token_version", lambda user_id: calls.append(user_id) or 0)
+    monkeypatch.setattr(storage, "get_user_token_versions", lambda user_ids: calls.append(user_ids) or {})
+
+    generate_tokens_many([test_user, admin_user])
+
+    assert calls == [[test_user.id, admin_user.id]]
+
+
+def test_verify_tokens_many(test_user, admin_user):
+    valid = generate_token(test_user).access_token
+    revoked = generate_token(admin_user).access_token
+    revoke_token(revoked)
+    other_user = User(id="other123", username="otheruser")
+    outdated = generate_token(other_user).access_token
+    _ensure_token_manager().token_storage.increment_user_token_version(other_user.id)
+
+    results = verify_tokens_many([valid, "invalid.token.string", revoked, outdated])
+
+    # Every token gets a result and failures don't stop the batch
+    assert results[0].user_id == test_user.id
+    assert results[1:] == [
+        "Invalid authentication credentials",
+        "Token has been revoked",
+        "Token version is outdated, please login again",
+    ]
+
+
+def test_async_token_lifecycle(test_user):
+    async def scenario():
+        tokens = await agenerate_token(test_user)
+        assert (await averify_token(tokens.access_token)).user_id == test_user.id
+
+        refreshed = await arefresh_token(tokens.refresh_token, test_user)
+        assert (await averify_token(refreshed.access_token)).user_id == test_user.id
+
+        await arevoke_token(refreshed.access_token)
+        with pytest.raises(HTTPException) as excinfo:
+            await averify_token(refreshed.access_token)
+        assert excinfo.value.status_code == 401
+
+    asyncio.run(scenario())
+
+
+def test_sync_adapter_runs_io_storage_off_the_event_loop():
+    class BlockingStorage(MemoryTokenStorage):
+        performs_io = True
+
+        def get_user_token_version(self, user_id):
+            threads.append(threading.current_thread())
+            return super().get_user_token_version(user_id)
+
+    threads = []
+    adapter = SyncTokenStorageAdapter(BlockingStorage())
+
+    async def scenario():
+        await adapter.get_user_token_version("user1")
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(scenario())
+    assert threads and threads[0] is not loop_thread
+
+
+def test_fast_token_data(admin_user):
+    setup_token_manager(secret_key="test_secret_key", fast_token_data=True, verify_cache_size=16)
+    user = User(id="admin123", username="adminuser", roles=["admin"], scopes=["orders:*"])
+    token = generate_token(user).access_token
+
+    token_data = verify_token(token)
+
+    assert isinstance(token_data, FastTokenData)
+    assert token_data.user_id == "admin123"
+    assert token_data.roles == ("admin",)
+    assert token_data.role_mask == TokenData(user_id="admin123", roles=["admin"]).role_mask
+    assert token_data.scope_matcher.allows("orders:read")
+    assert verify_token(token) is token_data
+    assert not hasattr(token_data, "__dict__")
+
+    model = token_data.to_model()
+    assert isinstance(model, TokenData)
+    assert model.model_dump() == {"user_id": "admin123", "roles": ["admin"], "scopes": ["orders:*"]}
+    assert jsonable_encoder(token_data) == {"user_id": "admin123", "roles": ["admin"], "scopes": ["orders:*"]}
+
+
+def test_fast_token_data_rejects_malformed_claims():
+    setup_token_manager(secret_key="test_secret_key", fast_token_data=True)
+    manager = _ensure_token_manager()
+    token = manager.create_token({"sub": "user123", "roles": "admin", "type": "access"})
+
+    with pytest.raises(HTTPException) as exc_info:
+        verify_token(token)
+    assert exc_info.value.status_code == 401